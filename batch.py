@@ -0,0 +1,166 @@
+"""headless batch processing of image directories
+
+usage example:
+    python batch.py input_dir output_dir --pipeline "gray,otsu,median:3" --workers 8
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import PIL.Image
+
+import cache
+from image_processing import Histogram, Brightness, Conversion, Binarization, Filter, PointPipeline
+
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.gif', '.tif', '.tiff', '.bmp')
+
+#pipeline step name -> (operation, parameter types)
+OPERATIONS = {
+    'normalize': (Histogram.normalize_histogram, (int, int)),
+    'equalize_gray': (Histogram.equalize_histogram_grayscale, ()),
+    'equalize_ycrcb': (Histogram.equalize_histogram_YCrCb, ()),
+    'gamma': (Brightness.gamma_correction, (float,)),
+    'gray': (Conversion.convert_2_gray, ()),
+    'threshold': (Binarization.binary_thresholding, (int,)),
+    'otsu': (Binarization.otsu, ()),
+    'niblack': (Binarization.niblack, (int, float)),
+    'sauvola': (Binarization.sauvola, (int, float)),
+    'wolf': (Binarization.wolf, (int, float)),
+    'phansalkar': (Binarization.phansalkar, (int, float)),
+    'linear': (lambda img, index: Filter.linear_filter(img, Filter.filters[index].astype(np.float32)), (int,)),
+    'prewitt_edges': (lambda img: Filter.filter_bank(img, Filter.prewitt_bank)[0], ()),
+    'sobel_edges': (lambda img: Filter.filter_bank(img, Filter.sobel_bank)[0], ()),
+    'median': (Filter.median, (int,)),
+    'percentile': (Filter.percentile_filter, (int, float)),
+    'box_blur': (Filter.box_blur, ()),
+    'gaussian_blur': (Filter.gaussian_blur, ()),
+    'kuwahara': (Filter.kuwahara_filter, (int,)),
+}
+
+
+#steps that are fused into a single lookup table when they follow each other
+POINT_STEPS = {
+    'normalize': PointPipeline.normalize,
+    'gamma': PointPipeline.gamma,
+    'threshold': PointPipeline.threshold,
+}
+
+
+class PipelineSpecError(ValueError):
+    pass
+
+
+def parse_pipeline(spec):
+    """parse "gray,otsu,median:3" into a list of (name, parameters)"""
+    steps = []
+    for step in spec.split(','):
+        name, *params = step.strip().split(':')
+        if name not in OPERATIONS:
+            raise PipelineSpecError('Unknown operation "{}"'.format(name))
+        types = OPERATIONS[name][1]
+        if len(params) != len(types):
+            raise PipelineSpecError('Operation "{}" takes {} parameter(s)'.format(name, len(types)))
+        try:
+            steps.append((name, tuple(t(p) for t, p in zip(types, params))))
+        except ValueError:
+            raise PipelineSpecError('Invalid parameters for operation "{}"'.format(name))
+    return steps
+
+
+def run_pipeline(image, steps):
+    points = None
+    for name, params in steps:
+        if name in POINT_STEPS:
+            points = points or PointPipeline()
+            POINT_STEPS[name](points, *params)
+            continue
+        if points is not None:
+            image, points = points.apply(image), None
+        image = OPERATIONS[name][0](image, *params)
+    if points is not None:
+        image = points.apply(image)
+    return image
+
+
+def process_file(source, destination, steps, use_cache=False):
+    """worker entry point, returns (source, megapixels, seconds),
+    use_cache reuses (and stores) the decoded source and the pipeline result in the image cache"""
+    start = time.perf_counter()
+    image = result = None
+    if use_cache:
+        image = cache.load(source)
+        result = cache.load(source, history=steps)
+    if image is None:
+        image = np.array(PIL.Image.open(source).convert('RGB'))
+        if use_cache:
+            cache.store(source, image)
+    if result is None:
+        result = run_pipeline(image, steps)
+        if use_cache:
+            cache.store(source, result, history=steps)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    PIL.Image.fromarray(result).save(destination)
+    return source, image.shape[0] * image.shape[1] / 1e6, time.perf_counter() - start
+
+
+def find_images(input_dir):
+    return sorted(p for p in Path(input_dir).rglob('*') if p.suffix.lower() in IMAGE_SUFFIXES)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Apply an image processing pipeline to every image in a directory.')
+    parser.add_argument('input_dir', type=Path)
+    parser.add_argument('output_dir', type=Path)
+    parser.add_argument('--pipeline', required=True,
+                        help='comma separated steps, parameters after colons, e.g. "gray,otsu,median:3". '
+                             'Available: ' + ', '.join(OPERATIONS))
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--format', default=None, help='output file suffix, defaults to the input suffix')
+    parser.add_argument('--cache', action='store_true',
+                        help='reuse decoded sources and pipeline results from the image cache '
+                             '(written to the user cache directory or IMAGE_CACHE_DIR, also read next to the sources)')
+    args = parser.parse_args(argv)
+
+    try:
+        steps = parse_pipeline(args.pipeline)
+    except PipelineSpecError as pse:
+        parser.error(str(pse))
+
+    sources = find_images(args.input_dir)
+    if not sources:
+        print('No images found in {}'.format(args.input_dir), file=sys.stderr)
+        return 1
+
+    failures = 0
+    total_megapixels = 0.0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {}
+        for source in sources:
+            destination = args.output_dir / source.relative_to(args.input_dir)
+            if args.format is not None:
+                destination = destination.with_suffix('.' + args.format.lstrip('.'))
+            futures[executor.submit(process_file, source, destination, steps, args.cache)] = source
+        for future in as_completed(futures):
+            try:
+                source, megapixels, seconds = future.result()
+            except Exception as e:
+                failures += 1
+                print('{}: FAILED ({})'.format(futures[future], e), file=sys.stderr)
+                continue
+            total_megapixels += megapixels
+            print('{}: {:.2f} MP in {:.3f} s ({:.2f} MP/s)'.format(source, megapixels, seconds, megapixels / seconds))
+    elapsed = time.perf_counter() - start
+
+    processed = len(sources) - failures
+    print('Processed {} image(s), {} failed, in {:.2f} s: {:.2f} images/s, {:.2f} MP/s with {} worker(s)'.format(
+        processed, failures, elapsed, processed / elapsed, total_megapixels / elapsed, args.workers))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,256 @@
+"""benchmark of every image_processing operation
+
+Measures throughput (megapixels per second) and peak memory allocated through
+numpy of each operation, writes the results as JSON and compares them with a
+stored baseline. When the baseline file does not exist yet, the results are
+written to it and nothing is compared.
+
+usage example:
+    python benchmark.py --sizes bundled 4k --output bench.json --baseline bench_baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import cv2 as cv
+import numpy as np
+import PIL.Image
+
+from image_processing import Histogram, Brightness, Conversion, Binarization, Filter, Batch
+from tiling import DEFAULT_WORKERS, process_bands
+
+BUNDLED_IMAGES = ['kontrolny1.tif', 'kontrolny2.tif', 'kontrolny3.tiff']
+
+#synthetic sizes as (width, height)
+SYNTHETIC_SIZES = {
+    '4k': (3840, 2160),
+    '16mp': (4608, 3456),
+    '64mp': (9216, 6912),
+}
+
+#kernel sizes offered by the dialogs
+MEDIAN_KERNELS = [3, 5, 15, 31, 51]
+WINDOW_KERNELS = list(range(3, 50, 2))
+QUICK_WINDOW_KERNELS = [3, 5, 15, 25, 49]
+
+LINEAR_FILTERS = {
+    'prewitt_0': 1,
+    'prewitt_45': 2,
+    'sobel_0': 9,
+    'laplace_1': 17,
+    'laplace_3': 19,
+    'edge_detection_1': 20,
+}
+
+#sizes of larger separable (gaussian) kernels, run through linear_filter and through a dense filter2D
+SEPARABLE_KERNEL_SIZES = [3, 7, 15, 31]
+
+
+#operations also run through process_bands, as (name, operation, parameters, input kind)
+BAND_OPERATIONS = [
+    ('Filter.kuwahara_filter', Filter.kuwahara_filter, (15,), 'rgb'),
+    ('Filter.median', Filter.median, (5,), 'rgb'),
+    ('Filter.gaussian_blur', Filter.gaussian_blur, (), 'rgb'),
+    ('Binarization.niblack', Binarization.niblack, (25, 0.6), 'gray'),
+]
+
+#side of the square crops of the Batch cases, the input is cut into a stack of them
+CROP_SIZE = 64
+
+
+def separate_histograms(img):
+    """the R, G, B and luminance histograms with the calls compute_histograms replaces"""
+    return ([Histogram.compute_histogram(img, [channel]) for channel in range(3)]
+            + [Histogram.compute_histogram(cv.cvtColor(img, cv.COLOR_RGB2GRAY), [0])])
+
+
+def benchmark_cases(window_kernels, workers=DEFAULT_WORKERS):
+    """list of (name, parameters, function, input kind), input kind is 'rgb', 'gray', 'rgb_crops' or 'gray_crops'"""
+    cases = [
+        ('Histogram.compute_histogram', {}, lambda img: Histogram.compute_histogram(img, [0]), 'rgb'),
+        ('Histogram.compute_histograms', {}, Histogram.compute_histograms, 'rgb'),
+        ('Histogram.compute_histograms', {'path': 'separate'}, separate_histograms, 'rgb'),
+        ('Histogram.equalize_histogram_grayscale', {}, Histogram.equalize_histogram_grayscale, 'rgb'),
+        ('Histogram.equalize_histogram_YCrCb', {}, Histogram.equalize_histogram_YCrCb, 'rgb'),
+        ('Histogram.normalize_histogram', {'a': 0, 'b': 255}, lambda img: Histogram.normalize_histogram(img, 0, 255), 'rgb'),
+        ('Brightness.gamma_correction', {'gamma': 0.5}, lambda img: Brightness.gamma_correction(img, 0.5), 'rgb'),
+        ('Conversion.convert_2_gray', {}, Conversion.convert_2_gray, 'rgb'),
+        ('Binarization.binary_thresholding', {'thresh': 127}, lambda img: Binarization.binary_thresholding(img, 127), 'gray'),
+        ('Binarization.otsu', {}, Binarization.otsu, 'gray'),
+        ('Filter.box_blur', {}, Filter.box_blur, 'rgb'),
+        ('Filter.gaussian_blur', {}, Filter.gaussian_blur, 'rgb'),
+    ]
+    for kernel in MEDIAN_KERNELS:
+        cases.append(('Filter.median', {'kernel': kernel}, lambda img, kernel=kernel: Filter.median(img, kernel), 'rgb'))
+        cases.append(('Filter.percentile_filter', {'kernel': kernel, 'percentile': 25},
+                      lambda img, kernel=kernel: Filter.percentile_filter(img, kernel, 25), 'rgb'))
+    for name, index in LINEAR_FILTERS.items():
+        kernel = Filter.filters[index].astype(np.float32)
+        cases.append(('Filter.linear_filter', {'kernel': name},
+                      lambda img, kernel=kernel: Filter.linear_filter(img, kernel), 'rgb'))
+    for name, bank in (('prewitt', Filter.prewitt_bank), ('sobel', Filter.sobel_bank)):
+        cases.append(('Filter.filter_bank', {'bank': name}, lambda img, bank=bank: Filter.filter_bank(img, bank), 'gray'))
+    for size in SEPARABLE_KERNEL_SIZES:
+        gaussian = cv.getGaussianKernel(size, 0)
+        kernel = (gaussian @ gaussian.T).astype(np.float32)
+        cases.append(('Filter.linear_filter', {'kernel': 'gaussian_{}'.format(size), 'path': 'auto'},
+                      lambda img, kernel=kernel: Filter.linear_filter(img, kernel), 'rgb'))
+        cases.append(('Filter.linear_filter', {'kernel': 'gaussian_{}'.format(size), 'path': 'dense'},
+                      lambda img, kernel=kernel: cv.filter2D(img, -1, kernel), 'rgb'))
+    for kernel in window_kernels:
+        cases.append(('Binarization.niblack', {'kernel': kernel, 'k': 0.6},
+                      lambda img, kernel=kernel: Binarization.niblack(img, kernel, 0.6), 'gray'))
+        cases.append(('Binarization.sauvola', {'kernel': kernel, 'k': 0.5},
+                      lambda img, kernel=kernel: Binarization.sauvola(img, kernel, 0.5), 'gray'))
+        cases.append(('Binarization.wolf', {'kernel': kernel, 'k': 0.5},
+                      lambda img, kernel=kernel: Binarization.wolf(img, kernel, 0.5), 'gray'))
+        cases.append(('Binarization.phansalkar', {'kernel': kernel, 'k': 0.25},
+                      lambda img, kernel=kernel: Binarization.phansalkar(img, kernel, 0.25), 'gray'))
+        cases.append(('Filter.kuwahara_filter', {'kernel': kernel},
+                      lambda img, kernel=kernel: Filter.kuwahara_filter(img, kernel), 'rgb'))
+    cases += [
+        ('Batch.convert_2_gray', {'crop': CROP_SIZE}, Batch.convert_2_gray, 'rgb_crops'),
+        ('Batch.compute_histogram', {'crop': CROP_SIZE}, Batch.compute_histogram, 'gray_crops'),
+        ('Batch.equalize_histogram_YCrCb', {'crop': CROP_SIZE}, Batch.equalize_histogram_YCrCb, 'rgb_crops'),
+        ('Batch.otsu', {'crop': CROP_SIZE}, Batch.otsu, 'gray_crops'),
+        ('Batch.niblack', {'crop': CROP_SIZE, 'kernel': 15, 'k': 0.6},
+         lambda stack: Batch.niblack(stack, 15, 0.6), 'gray_crops'),
+    ]
+    for name, operation, params, kind in BAND_OPERATIONS:
+        cases.append(('tiling.process_bands', {'operation': name, 'params': list(params), 'workers': workers},
+                      lambda img, operation=operation, params=params: process_bands(img, operation, *params, workers=workers),
+                      kind))
+    return cases
+
+
+def load_inputs(sizes):
+    """dict of input name -> RGB image"""
+    root = Path(__file__).parent
+    inputs = {}
+    if 'bundled' in sizes:
+        for name in BUNDLED_IMAGES:
+            inputs[name] = np.array(PIL.Image.open(root / name).convert('RGB'))
+    source = np.array(PIL.Image.open(root / BUNDLED_IMAGES[-1]).convert('RGB'))
+    for size in sizes:
+        if size in SYNTHETIC_SIZES:
+            inputs[size] = cv.resize(source, SYNTHETIC_SIZES[size], interpolation=cv.INTER_LINEAR)
+    return inputs
+
+
+def crop_stack(image, size=CROP_SIZE):
+    """(N, size, size[, C]) stack of the crops tiling the image, the remainder at the borders is dropped"""
+    rows, columns = image.shape[0] // size, image.shape[1] // size
+    crops = image[:rows * size, :columns * size].reshape((rows, size, columns, size) + image.shape[2:])
+    return np.ascontiguousarray(crops.swapaxes(1, 2)).reshape((rows * columns, size, size) + image.shape[2:])
+
+
+def measure(function, image, repeat):
+    """best wall time in seconds and peak memory in bytes allocated during one call"""
+    tracemalloc.start()
+    function(image)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(image)
+        best = min(best, time.perf_counter() - start)
+    return best, peak
+
+
+def case_key(result):
+    params = ','.join('{}={}'.format(k, v) for k, v in sorted(result['params'].items()))
+    return '{}[{}]@{}'.format(result['operation'], params, result['input'])
+
+
+def run(sizes, window_kernels, repeat, operations=None, workers=DEFAULT_WORKERS):
+    results = []
+    inputs = load_inputs(sizes)
+    for input_name, rgb in inputs.items():
+        gray = Conversion.convert_2_gray(rgb)
+        images = {'rgb': rgb, 'gray': gray, 'rgb_crops': crop_stack(rgb), 'gray_crops': crop_stack(gray)}
+        for name, params, function, kind in benchmark_cases(window_kernels, workers):
+            if operations and not any(op in name for op in operations):
+                continue
+            image = images[kind]
+            megapixels = image.size / (image.shape[-1] if kind.startswith('rgb') else 1) / 1e6
+            seconds, peak = measure(function, image, repeat)
+            result = {
+                'operation': name,
+                'params': params,
+                'input': input_name,
+                'shape': list(image.shape),
+                'seconds': seconds,
+                'megapixels_per_second': megapixels / seconds,
+                'peak_bytes': peak,
+            }
+            results.append(result)
+            print('{:70s} {:10.2f} MP/s {:10.1f} MB'.format(
+                case_key(result), result['megapixels_per_second'], peak / 2**20))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """list of (key, baseline MP/s, current MP/s) of cases slower than baseline by more than tolerance"""
+    previous = {case_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get(case_key(result))
+        if before is None:
+            continue
+        if result['megapixels_per_second'] < before['megapixels_per_second'] * (1 - tolerance):
+            regressions.append((case_key(result), before['megapixels_per_second'], result['megapixels_per_second']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark image_processing operations.')
+    parser.add_argument('--sizes', nargs='+', default=['bundled', '4k'],
+                        choices=['bundled'] + list(SYNTHETIC_SIZES), help='inputs to benchmark')
+    parser.add_argument('--all-kernels', action='store_true',
+                        help='every window size the dialogs allow instead of a representative subset')
+    parser.add_argument('--operations', nargs='*', help='only operations whose name contains one of these')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='threads of the process_bands cases')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per case, the best one is kept')
+    parser.add_argument('--output', type=Path, default=Path('bench_results.json'))
+    parser.add_argument('--baseline', type=Path, help='results file to compare with, created when missing')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed relative throughput drop')
+    args = parser.parse_args(argv)
+
+    window_kernels = WINDOW_KERNELS if args.all_kernels else QUICK_WINDOW_KERNELS
+    results = run(args.sizes, window_kernels, args.repeat, args.operations, args.workers)
+    report = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+    args.output.write_text(json.dumps(report, indent=2))
+    print('Results written to {}'.format(args.output))
+
+    if args.baseline is not None:
+        if not args.baseline.exists():
+            args.baseline.write_text(json.dumps(report, indent=2))
+            print('No baseline at {0}, nothing was compared; these results are stored in {0} '
+                  'as the baseline of the next runs'.format(args.baseline))
+            return 0
+        baseline = json.loads(args.baseline.read_text())
+        compared = {case_key(result) for result in baseline['results']} & {case_key(result) for result in results}
+        regressions = compare(results, baseline, args.tolerance)
+        for key, before, after in regressions:
+            print('REGRESSION {}: {:.2f} -> {:.2f} MP/s'.format(key, before, after))
+        if regressions:
+            return 1
+        print('No regressions in {} of {} cases found in {}'.format(len(compared), len(results), args.baseline))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""on-disk cache of decoded and processed images
+
+A cache file holds one image as raw rows after a small JSON header with
+its shape, dtype, channel order, the source file it was made from and the
+processing history applied to it. The data is aligned so loading is a
+copy-on-write np.memmap instead of a decode. Cache files are written to a
+per-user cache directory (IMAGE_CACHE_DIR overrides it), files found next to
+the source are read as well. They are reused only while the size, mtime and
+hash of the source still match. Files in the cache directory that were not
+used for a while, and the least recently used ones beyond a size cap, are
+deleted whenever a new one is stored.
+
+usage example:
+    image = cache.load('kontrolny1.tif')
+    if image is None:
+        image = decode('kontrolny1.tif')
+        cache.store('kontrolny1.tif', image)
+"""
+import hashlib
+import json
+import os
+import struct
+import time
+from pathlib import Path
+
+import numpy as np
+
+MAGIC = b'IMGCACHE'
+FORMAT_VERSION = 1
+SUFFIX = '.imgcache'
+#data starts at a multiple of this, so it can be mapped with any page size
+DATA_ALIGNMENT = 4096
+#bytes read or written at a time
+CHUNK_BYTES = 4 * 1024 * 1024
+
+def _user_cache_dir():
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA', Path.home() / 'AppData' / 'Local')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')
+    return Path(base) / 'podstawy-biometrii'
+
+#directory cache files are written to
+CACHE_DIR = Path(os.environ.get('IMAGE_CACHE_DIR') or _user_cache_dir())
+#IMAGE_CACHE=1 makes the interface write a cache file of every page it opens, existing ones are always read
+WRITE_CACHE = os.environ.get('IMAGE_CACHE', '0') == '1'
+#IMAGE_CACHE_MAX_MB overrides the bytes kept in CACHE_DIR
+MAX_CACHE_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_MB', 2048)) * 1024 * 1024
+#files of CACHE_DIR not used for this many seconds are deleted
+MAX_CACHE_AGE = 30 * 24 * 60 * 60
+
+#channel order recorded for the number of channels of the image
+CHANNEL_ORDERS = {1: 'L', 3: 'RGB', 4: 'RGBA'}
+
+
+class CacheFormatError(ValueError):
+    pass
+
+
+def _history(history):
+    """history as stored in the header, (operation, parameters) steps turned into JSON lists"""
+    return json.loads(json.dumps([list(step) for step in history]))
+
+def _key(page, history):
+    """short digest of the page and processing history, distinguishes cache files of the same source"""
+    return hashlib.sha256(json.dumps([page, _history(history)]).encode()).hexdigest()[:12]
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_BYTES), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return {'name': Path(path).name, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': _sha256(path)}
+
+
+def cache_paths(source, page=0, history=()):
+    """candidate cache files of the source, the one next to it first (only read), the one in CACHE_DIR last"""
+    source = Path(source)
+    name = '{}.{}{}'.format(source.name, _key(page, history), SUFFIX)
+    #sources with the same name in different directories must not share a cache file
+    directory = hashlib.sha256(str(source.resolve().parent).encode()).hexdigest()[:8]
+    return [source.with_name(name), CACHE_DIR / '{}-{}'.format(directory, name)]
+
+
+def write(path, image, header):
+    """write image and header to path, the file is replaced atomically"""
+    image = np.asarray(image)
+    channels = 1 if image.ndim == 2 else image.shape[2]
+    header = dict(header, version=FORMAT_VERSION, shape=list(image.shape), dtype=image.dtype.str,
+                  channel_order=CHANNEL_ORDERS.get(channels, 'unknown'))
+    #rows are written CHUNK_BYTES at a time, so no copy of the whole image is made
+    chunk_rows = max(1, CHUNK_BYTES // max(image[:1].nbytes, 1))
+    text = json.dumps(header).encode()
+    prefix = len(MAGIC) + 4
+    offset = -(-(prefix + len(text)) // DATA_ALIGNMENT) * DATA_ALIGNMENT
+    path = Path(path)
+    temporary = path.with_name(path.name + '.tmp')
+    with open(temporary, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(text)) + text)
+        f.write(b' ' * (offset - prefix - len(text)))
+        for top in range(0, image.shape[0], chunk_rows):
+            f.write(np.ascontiguousarray(image[top:top + chunk_rows]).tobytes())
+    os.replace(temporary, path)
+    return path
+
+
+def read_header(path):
+    """(header, data offset) of a cache file"""
+    with open(path, 'rb') as f:
+        prefix = f.read(len(MAGIC) + 4)
+        if len(prefix) != len(MAGIC) + 4 or prefix[:len(MAGIC)] != MAGIC:
+            raise CacheFormatError('{} is not an image cache file'.format(path))
+        length, = struct.unpack('<I', prefix[len(MAGIC):])
+        header = json.loads(f.read(length))
+    if header.get('version') != FORMAT_VERSION:
+        raise CacheFormatError('{} has unsupported cache version {}'.format(path, header.get('version')))
+    return header, -(-(len(prefix) + length) // DATA_ALIGNMENT) * DATA_ALIGNMENT
+
+
+def open_cached(path):
+    """copy-on-write memory map of the image in a cache file, writing to it never changes the file"""
+    header, offset = read_header(path)
+    #plain ndarray view, so results of operations on it are not memmaps themselves
+    return np.memmap(path, np.dtype(header['dtype']), 'c', offset=offset, shape=tuple(header['shape'])).view(np.ndarray)
+
+
+def _matches(header, source):
+    """whether the cache was made from the current contents of source, the hash is checked last"""
+    recorded = header.get('source', {})
+    stat = os.stat(source)
+    if recorded.get('size') != stat.st_size or recorded.get('mtime_ns') != stat.st_mtime_ns:
+        return False
+    return recorded.get('sha256') == _sha256(source)
+
+
+def load(source, page=0, history=()):
+    """cached image of the page of source after the history steps, None when there is no valid cache"""
+    for path in cache_paths(source, page, history):
+        if not path.exists():
+            continue
+        try:
+            header, _ = read_header(path)
+            if header.get('page') == page and header.get('history') == _history(history) \
+                    and _matches(header, source):
+                image = open_cached(path)
+                if path.parent == CACHE_DIR:
+                    _touch(path)
+                return image
+        except (OSError, ValueError):
+            continue
+    return None
+
+
+def store(source, image, page=0, history=()):
+    """cache the image of the page of source after the history steps in CACHE_DIR, returns the cache file
+    or None when it is not writable"""
+    path = cache_paths(source, page, history)[-1]
+    header = {'source': _fingerprint(source), 'page': page, 'history': _history(history)}
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path = write(path, image, header)
+    except OSError:
+        return None
+    prune()
+    return path
+
+
+def _touch(path):
+    #the mtime tells prune when the file was last used
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def prune(max_bytes=MAX_CACHE_BYTES, max_age=MAX_CACHE_AGE):
+    """delete the files of CACHE_DIR not used for max_age seconds, and the least recently used ones until the
+    rest fit in max_bytes; files next to the sources are never deleted"""
+    files = []
+    for path in CACHE_DIR.glob('*' + SUFFIX):
+        try:
+            files.append((path.stat(), path))
+        except OSError:
+            continue
+    now = time.time()
+    kept = 0
+    for stat, path in sorted(files, key=lambda file: file[0].st_mtime, reverse=True):
+        if now - stat.st_mtime <= max_age and kept + stat.st_size <= max_bytes:
+            kept += stat.st_size
+            continue
+        try:
+            path.unlink()
+        except OSError:
+            #removed by another process, or in use on Windows
+            pass
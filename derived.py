@@ -0,0 +1,120 @@
+"""cache of representations derived from images: grayscale, YCrCb planes, histograms, pyramid levels
+
+Only images registered with track keep entries, others (tiles, bands,
+preview proxies) get their representations built every time. Entries are
+built lazily on first use and dropped when the image is freed, when its
+owner reports a write with invalidate, or when the least recently used
+entries exceed the byte budget. Cached arrays are read-only, consumers copy
+before changing them.
+
+usage example:
+    cache.track(image)
+    gray = cache.get(image, ('gray',), lambda: cv.cvtColor(image, cv.COLOR_RGB2GRAY))
+"""
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+#IMAGE_DERIVED_BUDGET_MB overrides the bytes kept for derived representations
+DEFAULT_BUDGET = int(os.environ.get('IMAGE_DERIVED_BUDGET_MB', 256)) * 1024 * 1024
+
+
+def _nbytes(value):
+    if isinstance(value, tuple):
+        return sum(_nbytes(item) for item in value)
+    return getattr(value, 'nbytes', 0)
+
+def _read_only(value):
+    if isinstance(value, tuple):
+        return tuple(_read_only(item) for item in value)
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    return value
+
+
+class DerivedCache:
+    """derived representations keyed by (image, kind), limited to budget bytes; safe to use from worker threads"""
+    def __init__(self, budget=DEFAULT_BUDGET):
+        self.budget = budget
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        #weak references to the tracked images and the number of times they were invalidated, by id
+        self._images = {}
+        self._generations = {}
+        #reentrant, freeing an image inside the lock runs the weak reference callback
+        self._lock = threading.RLock()
+
+    def track(self, image):
+        """keep the representations of image until it is freed or invalidated"""
+        with self._lock:
+            if id(image) not in self._images:
+                self._images[id(image)] = weakref.ref(image, lambda _, image_id=id(image): self._forget(image_id))
+                self._generations[id(image)] = 0
+
+    def get(self, image, kind, build):
+        """cached value of kind for image, build() computes it on a miss or when image is not tracked"""
+        value = self.peek(image, kind)
+        if value is None:
+            generation = self._generations.get(id(image))
+            #built outside the lock, a concurrent miss of the same entry only costs the work twice
+            value = self.put(image, kind, build(), generation)
+        return value
+
+    def peek(self, image, kind):
+        """cached value of kind for image, None when it is not cached"""
+        key = (id(image), kind)
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, image, kind, value, generation=None):
+        """store value as kind of image and return it, read-only when it is kept;
+        values of untracked images, values larger than the budget and values built from an image
+        invalidated after generation are not kept"""
+        size = _nbytes(value)
+        key = (id(image), kind)
+        with self._lock:
+            if size > self.budget or id(image) not in self._images:
+                return value
+            if generation is not None and generation != self._generations[id(image)]:
+                return value
+            value = _read_only(value)
+            if key in self._entries:
+                self.nbytes -= _nbytes(self._entries.pop(key))
+            self._entries[key] = value
+            self.nbytes += size
+            while self.nbytes > self.budget:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= _nbytes(evicted)
+        return value
+
+    def invalidate(self, image):
+        """drop every entry of image, called after the image was written in place"""
+        with self._lock:
+            if id(image) in self._generations:
+                self._generations[id(image)] += 1
+            for key in [key for key in self._entries if key[0] == id(image)]:
+                self.nbytes -= _nbytes(self._entries.pop(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._images.clear()
+            self._generations.clear()
+            self.nbytes = 0
+
+    def _forget(self, image_id):
+        with self._lock:
+            self._images.pop(image_id, None)
+            self._generations.pop(image_id, None)
+            for key in [key for key in self._entries if key[0] == image_id]:
+                self.nbytes -= _nbytes(self._entries.pop(key))
+
+
+#shared by image_processing and the image shown in the window
+cache = DerivedCache()
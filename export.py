@@ -0,0 +1,63 @@
+"""export of an image to several formats at once
+
+Every format is encoded on its own thread, the PIL encoders release the GIL
+while compressing, so the formats are written in parallel.
+
+usage example:
+    for path, seconds, size in export_image(image, 'scan_edit', ['png', 'tiff'], {'png': {'compress_level': 1}}):
+        print(path, seconds, size)
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import PIL.Image
+
+#file suffix -> PIL format and default encoder options
+FORMATS = {
+    'png': ('PNG', {'compress_level': 6}),
+    'tif': ('TIFF', {'compression': 'tiff_lzw'}),
+    'tiff': ('TIFF', {'compression': 'tiff_lzw'}),
+    'bmp': ('BMP', {}),
+    'jpg': ('JPEG', {'quality': 95}),
+    'jpeg': ('JPEG', {'quality': 95}),
+    'gif': ('GIF', {}),
+}
+
+#TIFF compression name -> PIL compression option
+TIFF_COMPRESSIONS = {
+    'None': 'raw',
+    'LZW': 'tiff_lzw',
+    'Deflate': 'tiff_adobe_deflate',
+    'PackBits': 'packbits',
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def encode(image, path, **options):
+    """write image to path in the format of its suffix, returns (path, seconds, bytes written)"""
+    path = Path(path)
+    suffix = path.suffix.lower().lstrip('.')
+    if suffix not in FORMATS:
+        raise ExportError('Unsupported export format "{}"'.format(suffix))
+    name, defaults = FORMATS[suffix]
+    start = time.perf_counter()
+    PIL.Image.fromarray(image).save(path, name, **dict(defaults, **options))
+    return path, time.perf_counter() - start, path.stat().st_size
+
+
+def export_image(image, base, formats, options=None):
+    """encode image as base with every suffix of formats in parallel, options maps a suffix to its encoder
+    options, returns (path, seconds, bytes) of every format in the order of formats"""
+    options = options or {}
+    image = np.ascontiguousarray(image)
+    base = Path(base)
+    with ThreadPoolExecutor(max_workers=max(min(len(formats), os.cpu_count() or 1), 1)) as executor:
+        futures = [executor.submit(encode, image, base.with_name(base.name + '.' + suffix), **options.get(suffix, {}))
+                   for suffix in formats]
+        return [future.result() for future in futures]
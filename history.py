@@ -0,0 +1,158 @@
+"""undo/redo history of image changes stored as compressed deltas
+
+Every step keeps only what is needed to move between the two images:
+ - a lookup table and its inverse when the change is an invertible point mapping,
+ - XOR deltas of the changed tiles when the shape stays the same,
+ - the compressed previous image plus a replayable operation otherwise.
+"""
+import zlib
+from collections import deque
+
+import numpy as np
+
+DEFAULT_BUDGET = 64 * 1024 * 1024
+TILE_SIZE = 64
+COMPRESSION_LEVEL = 1
+
+
+def _compress(array):
+    return zlib.compress(np.ascontiguousarray(array).tobytes(), COMPRESSION_LEVEL)
+
+def _decompress(data, shape, dtype):
+    return np.frombuffer(zlib.decompress(data), dtype).reshape(shape)
+
+
+class _LutStep:
+    """point mapping that is injective on the values of the image, undone with the inverse table"""
+    def __init__(self, lut, inverse):
+        self.lut = lut
+        self.inverse = inverse
+        self.nbytes = lut.nbytes + inverse.nbytes
+
+    def undo(self, current):
+        return self.inverse[current]
+
+    def redo(self, current):
+        return self.lut[current]
+
+
+class _TileStep:
+    """XOR deltas of changed tiles, the same delta moves the image both ways"""
+    def __init__(self, tiles):
+        self.tiles = tiles
+        self.nbytes = sum(len(data) for _, data, _ in tiles)
+
+    def _apply(self, current):
+        image = current.copy()
+        for (top, left), data, shape in self.tiles:
+            bottom, right = top + shape[0], left + shape[1]
+            image[top:bottom, left:right] ^= _decompress(data, shape, image.dtype)
+        return image
+
+    undo = _apply
+    redo = _apply
+
+
+class _ReplaceStep:
+    """previous image kept compressed, redone by replaying the operation or from the compressed result"""
+    def __init__(self, before, after, operation, params):
+        self.before = (_compress(before), before.shape, before.dtype)
+        self.replay = (operation, params) if operation is not None else None
+        self.after = None if operation is not None else (_compress(after), after.shape, after.dtype)
+        self.nbytes = len(self.before[0]) + (len(self.after[0]) if self.after is not None else 0)
+
+    def undo(self, current):
+        return _decompress(*self.before).copy()
+
+    def redo(self, current):
+        if self.replay is not None:
+            operation, params = self.replay
+            return operation(current, *params)
+        return _decompress(*self.after).copy()
+
+
+def _lut_step(before, after):
+    """_LutStep when after is an invertible per-value mapping of before, otherwise None"""
+    if before.shape != after.shape or before.dtype != np.uint8 or after.dtype != np.uint8:
+        return None
+    lut = np.zeros(256, np.uint8)
+    lut[before.ravel()] = after.ravel()
+    if not np.array_equal(lut[before], after):
+        return None
+    present = np.flatnonzero(np.bincount(before.ravel(), minlength=256))
+    if np.unique(lut[present]).size != present.size:
+        return None
+    inverse = np.zeros(256, np.uint8)
+    inverse[lut[present]] = present
+    return _LutStep(lut, inverse)
+
+
+def make_step(before, after, operation=None, params=()):
+    """step moving between before and after, the costly part of recording a change;
+    it only reads the two images, so it can be built on a worker thread and pushed later"""
+    before, after = np.asarray(before), np.asarray(after)
+    step = _lut_step(before, after)
+    if step is None and before.shape == after.shape and before.dtype == after.dtype:
+        step = _tile_step(before, after)
+    if step is None:
+        step = _ReplaceStep(before, after, operation, params)
+    return step
+
+
+def _tile_step(before, after, origin=(0, 0)):
+    difference = np.bitwise_xor(before, after)
+    tiles = []
+    height, width = difference.shape[:2]
+    for top in range(0, height, TILE_SIZE):
+        for left in range(0, width, TILE_SIZE):
+            tile = difference[top:top + TILE_SIZE, left:left + TILE_SIZE]
+            if tile.any():
+                tiles.append(((origin[0] + top, origin[1] + left), _compress(tile), tile.shape))
+    return _TileStep(tiles)
+
+
+class History:
+    """undo and redo stacks limited to budget bytes, the oldest steps are dropped first"""
+    def __init__(self, budget=DEFAULT_BUDGET):
+        self.budget = budget
+        self.undo_stack = deque()
+        self.redo_stack = deque()
+
+    @property
+    def nbytes(self):
+        return sum(step.nbytes for step in self.undo_stack) + sum(step.nbytes for step in self.redo_stack)
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+
+    def record(self, before, after, operation=None, params=()):
+        """record the change from before to after, operation and params allow replaying it on redo"""
+        self.push(make_step(before, after, operation, params))
+
+    def record_region(self, origin, before, after):
+        """record a change limited to the patch of the image starting at origin (top, left)"""
+        self.push(_tile_step(np.asarray(before), np.asarray(after), origin))
+
+    def undo(self, current):
+        """image before the last step, None when there is nothing to undo"""
+        if not self.undo_stack:
+            return None
+        step = self.undo_stack.pop()
+        self.redo_stack.append(step)
+        return step.undo(current)
+
+    def redo(self, current):
+        """image after the last undone step, None when there is nothing to redo"""
+        if not self.redo_stack:
+            return None
+        step = self.redo_stack.pop()
+        self.undo_stack.append(step)
+        return step.redo(current)
+
+    def push(self, step):
+        """add a step made with make_step, the redo stack is dropped"""
+        self.undo_stack.append(step)
+        self.redo_stack.clear()
+        while self.undo_stack and self.nbytes > self.budget:
+            self.undo_stack.popleft()
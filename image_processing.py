@@ -1,78 +1,502 @@
-import cv2 as cv
+import importlib
 import numpy as np
+from functools import lru_cache
+
+from derived import cache as derived_cache
+
+
+class _LazyModule:
+    """module imported on the first attribute access, keeps OpenCV out of the application start"""
+    def __init__(self, name, alias):
+        self._name = name
+        self._alias = alias
+
+    def __getattr__(self, attribute):
+        module = importlib.import_module(self._name)
+        #later accesses go to the module directly
+        globals()[self._alias] = module
+        return getattr(module, attribute)
+
+cv = _LazyModule('cv2', 'cv')
+
+def as_array(img):
+    """view any buffer or array-like object as a contiguous ndarray, copying only when it is not one already"""
+    return np.ascontiguousarray(img)
+
+#every operation accepts an optional out array of the result's shape and dtype,
+#passing the input array itself as out processes the image in place
+#(then call derived_cache.invalidate on it if it is tracked)
+
+def representation(img, kind, *params):
+    """derived representation of the image, cached in derived_cache while the image is tracked:
+    'gray', 'ycrcb', 'histograms', 'pyramid' with the level"""
+    image = as_array(img)
+    return derived_cache.get(image, (kind,) + params, lambda: _REPRESENTATIONS[kind](image, *params))
 
 class Histogram:
     """logic dealing with histogram"""
     @staticmethod
     def compute_histogram(img, channel):
-        image = np.array(img)
-        return cv.calcHist(image, channel, None, [256],[0, 256])
+        image = as_array(img)
+        return cv.calcHist([image], channel, None, [256],[0, 256])
     
     @staticmethod
-    def equalize_histogram_grayscale(img):
-        image = np.array(img)
-        image = cv.cvtColor(image, cv.COLOR_RGB2GRAY)
-        image  = cv.equalizeHist(image)
-        image = cv.cvtColor(image, cv.COLOR_GRAY2RGB)
+    def compute_histograms(img):
+        """R, G, B and luminance histograms as rows of a (4, 256) array"""
+        image = as_array(img)
+        if len(image.shape) == 2:
+            hist = cv.calcHist([image], [0], None, [256], [0, 256]).ravel()
+            return np.tile(hist.astype(np.int64), (4, 1))
+        #one calcHist per plane, the luminance plane is taken from the derived cache when it is there
+        planes = [(image, channel) for channel in range(3)] + [(representation(image, 'gray'), 0)]
+        return np.array([cv.calcHist([plane], [channel], None, [256], [0, 256]).ravel() for plane, channel in planes],
+                        np.int64)
+
+    @staticmethod
+    def equalize_histogram_grayscale(img, out=None):
+        image = cv.equalizeHist(representation(img, 'gray'))
+        image = cv.cvtColor(image, cv.COLOR_GRAY2RGB, out)
         return image
     
     @staticmethod    
-    def equalize_histogram_YCrCb(img):
-        image = np.array(img)
-        y, cr, cb = cv.split(cv.cvtColor(image, cv.COLOR_RGB2YCrCb))
-        y = cv.equalizeHist(y)
-        image = cv.merge((y, cr, cb))
-        image = cv.cvtColor(image, cv.COLOR_YCrCb2RGB)
+    def equalize_histogram_YCrCb(img, out=None):
+        #the cached planes are read-only
+        ycrcb = representation(img, 'ycrcb').copy()
+        ycrcb[:, :, 0] = cv.equalizeHist(ycrcb[:, :, 0])
+        image = cv.cvtColor(ycrcb, cv.COLOR_YCrCb2RGB, out)
         return image
 
     @staticmethod    
-    def normalize_histogram(img, a, b):
-        image = np.array(img)
-        return cv.normalize(image, None, a, b, cv.NORM_MINMAX)
+    def normalize_histogram(img, a, b, out=None):
+        image = as_array(img)
+        return cv.normalize(image, out, a, b, cv.NORM_MINMAX)
 
 class Brightness:
     @staticmethod
-    def gamma_correction(img, gamma):
-        image = np.array(img)
-        lookUpTable = np.empty((1,256), np.uint8)
-        for i in range(256):
-            lookUpTable[0,i] = np.clip(pow(i / 255.0, gamma) * 255.0, 0, 255)
-        return cv.LUT(image, lookUpTable)
+    def gamma_correction(img, gamma, out=None):
+        image = as_array(img)
+        return cv.LUT(image, _gamma_table(gamma), out)
 
 class Conversion:
     @staticmethod
-    def convert_2_gray(img):
-        image = np.array(img)
-        return cv.cvtColor(image, cv.COLOR_RGB2GRAY)
+    def convert_2_gray(img, out=None):
+        image = as_array(img)
+        gray = derived_cache.peek(image, ('gray',))
+        if gray is None:
+            return cv.cvtColor(image, cv.COLOR_RGB2GRAY, out)
+        if out is None:
+            return gray.copy()
+        np.copyto(out, gray)
+        return out
+
+    @staticmethod
+    def pyramid_down(img, out=None):
+        """image blurred and downsampled to half of its width and height"""
+        image = as_array(img)
+        return cv.pyrDown(image, out)
 
 class GrayscaleConversionError(Exception):
     pass
 
 class Binarization:
     @staticmethod
-    def binary_thresholding(img, thresh):
-        image = np.array(img)
+    def binary_thresholding(img, thresh, out=None):
+        image = as_array(img)
         if len(image.shape) != 2:
             raise GrayscaleConversionError('Image needs to be converted to grayscale')
-        _, result = cv.threshold(img,thresh,255,cv.THRESH_BINARY)
+        _, result = cv.threshold(image,thresh,255,cv.THRESH_BINARY,out)
         return result
 
     @staticmethod
-    def otsu(img):
-        image = np.array(img)
+    def otsu(img, out=None):
+        image = as_array(img)
         if len(image.shape) != 2:
             raise GrayscaleConversionError('Image needs to be converted to grayscale')
-        _, result = cv.threshold(image,0,255,cv.THRESH_BINARY+cv.THRESH_OTSU)
+        _, result = cv.threshold(image,0,255,cv.THRESH_BINARY+cv.THRESH_OTSU,out)
         return result
 
     @staticmethod
-    def niblack(img, kernel, k):
-        k = -k
-        image = np.array(img)
-        if len(image.shape) != 2:
+    def niblack(img, kernel, k, out=None):
+        local = LocalThreshold(img, kernel)
+        return local.binarize(_niblack_threshold(local, k), out)
+
+    @staticmethod
+    def sauvola(img, kernel, k=0.5, r=128, out=None):
+        local = LocalThreshold(img, kernel)
+        return local.binarize(local.sauvola(k, r), out)
+
+    @staticmethod
+    def wolf(img, kernel, k=0.5, out=None):
+        local = LocalThreshold(img, kernel)
+        return local.binarize(local.wolf(k), out)
+
+    @staticmethod
+    def phansalkar(img, kernel, k=0.25, p=2.0, q=10.0, r=0.5, out=None):
+        local = LocalThreshold(img, kernel)
+        return local.binarize(local.phansalkar(k, p, q, r), out)
+
+
+class LocalThreshold:
+    """windowed mean and standard deviation of a grayscale image taken from integral images,
+    so the cost per pixel does not depend on the window size
+
+    usage example, threshold tuning reusing the same statistics:
+        local = LocalThreshold(gray, 25)
+        for k, binary in local.sweep(local.sauvola, [0.1, 0.2, 0.3]):
+            ...
+    """
+    def __init__(self, img, window, stack=False):
+        """stack takes an (N, H, W) array of grayscale images, statistics are then computed per image"""
+        self.image = as_array(img)
+        if len(self.image.shape) != (3 if stack else 2):
             raise GrayscaleConversionError('Image needs to be converted to grayscale')
-        image = cv.bitwise_not(image)
-        return cv.ximgproc.niBlackThreshold(image, 255, cv.THRESH_BINARY_INV , kernel, k)
+        self.window = window
+        #replicated border, the same as the boxFilter of cv.ximgproc.niBlackThreshold
+        half = window // 2
+        area = float(window * window)
+        if stack:
+            #padded images stacked into one tall image, one pair of integral images covers all of them
+            padded = np.pad(self.image, ((0, 0), (half, window - half - 1), (half, window - half - 1)), mode='edge')
+            n, padded_height = padded.shape[:2]
+            integral, sq_integral = cv.integral2(padded.reshape(n * padded_height, -1),
+                                                 sdepth=cv.CV_64F, sqdepth=cv.CV_64F)
+            sums, sq_sums = (_stacked_box_sum(table, window, n, padded_height, self.image.shape[1])
+                             for table in (integral, sq_integral))
+        else:
+            integral, sq_integral = _integrals(self.image, half, window - half - 1)
+            sums, sq_sums = _box_sum(integral, window), _box_sum(sq_integral, window)
+        self.mean = sums
+        self.mean /= area
+        variance = sq_sums
+        variance /= area
+        variance -= np.square(self.mean)
+        self.std = np.sqrt(np.maximum(variance, 0, out=variance), out=variance)
+
+    def niblack(self, k):
+        return self.mean + k * self.std
+
+    def sauvola(self, k=0.5, r=128):
+        return self.mean * (1 + k * (self.std / r - 1))
+
+    def wolf(self, k=0.5):
+        #minimum intensity and maximum deviation of every image
+        low = self.image.min(axis=(-2, -1), keepdims=True).astype(np.float64)
+        r = np.maximum(self.std.max(axis=(-2, -1), keepdims=True), 1e-12)
+        return (1 - k) * self.mean + k * low + k * self.std / r * (self.mean - low)
+
+    def phansalkar(self, k=0.25, p=2.0, q=10.0, r=0.5):
+        #defined on intensities normalized to [0, 1]
+        mean = self.mean / 255
+        return 255 * mean * (1 + p * np.exp(-q * mean) + k * (self.std / 255 / r - 1))
+
+    def binarize(self, threshold, out=None):
+        """255 where the image reaches the threshold, 0 elsewhere"""
+        if out is None:
+            out = np.empty(self.image.shape, np.uint8)
+        np.greater_equal(self.image, threshold, out=out)
+        np.multiply(out, 255, out=out)
+        return out
+
+    def sweep(self, method, ks, **params):
+        """yield (k, binary image) for every k, computed from the same windowed statistics"""
+        for k in ks:
+            yield k, self.binarize(method(k, **params))
+
+
+def _niblack_threshold(local, k):
+    #threshold rounded on the inverted image, as the former cv.ximgproc.niBlackThreshold call did
+    threshold = np.subtract(255, local.niblack(k))
+    np.clip(np.rint(threshold, out=threshold), 0, 255, out=threshold)
+    return np.subtract(255, threshold, out=threshold)
+
+
+class Batch:
+    """operations on a stack of same-sized images, an (N, H, W) grayscale or (N, H, W, C) color array,
+    processed as a whole instead of image by image; results are the same as the single image operations
+
+    usage example:
+        gray = Batch.convert_2_gray(crops)
+        binary = Batch.otsu(gray)
+    """
+    @staticmethod
+    def compute_histogram(stack, channel=0):
+        """(N, 256) histograms of the channel of every image, the channel is ignored for grayscale stacks"""
+        stack = as_array(stack)
+        values = stack[..., channel] if len(stack.shape) == 4 else stack
+        hists = np.empty((len(stack), 256), np.int64)
+        for start in range(0, len(stack), 256):
+            hists[start:start + 256] = _stack_histograms(values[start:start + 256])
+        return hists
+
+    @staticmethod
+    def equalize_histogram_grayscale(stack, out=None):
+        gray = Batch.convert_2_gray(stack)
+        _apply_tables(gray, _equalize_tables(Batch.compute_histogram(gray)), gray)
+        n, height, width = gray.shape
+        if out is None:
+            out = np.empty(gray.shape + (3,), np.uint8)
+        if n == 0:
+            return out
+        cv.cvtColor(gray.reshape(n * height, width), cv.COLOR_GRAY2RGB, out.reshape(n * height, width, 3))
+        return out
+
+    @staticmethod
+    def equalize_histogram_YCrCb(stack, out=None):
+        stack = _color_stack(stack)
+        n, height, width = stack.shape[:3]
+        if n == 0:
+            return np.empty(stack.shape, np.uint8) if out is None else out
+        ycrcb = cv.cvtColor(stack.reshape(n * height, width, 3), cv.COLOR_RGB2YCrCb).reshape(stack.shape)
+        luma = np.ascontiguousarray(ycrcb[..., 0])
+        ycrcb[..., 0] = _apply_tables(luma, _equalize_tables(Batch.compute_histogram(luma)), luma)
+        if out is None:
+            out = np.empty(stack.shape, np.uint8)
+        cv.cvtColor(ycrcb.reshape(n * height, width, 3), cv.COLOR_YCrCb2RGB, out.reshape(n * height, width, 3))
+        return out
+
+    @staticmethod
+    def normalize_histogram(stack, a, b, out=None):
+        """every image stretched from its own minimum and maximum to [a, b]"""
+        stack = as_array(stack)
+        axes = tuple(range(1, len(stack.shape)))
+        return _apply_tables(stack, _normalize_tables(a, b, stack.min(axis=axes), stack.max(axis=axes)), out)
+
+    @staticmethod
+    def gamma_correction(stack, gamma, out=None):
+        stack = as_array(stack)
+        return _apply_table(stack, _gamma_table(gamma), out)
+
+    @staticmethod
+    def convert_2_gray(stack, out=None):
+        stack = _color_stack(stack)
+        n, height, width = stack.shape[:3]
+        if out is None:
+            out = np.empty((n, height, width), np.uint8)
+        if n == 0:
+            return out
+        cv.cvtColor(stack.reshape(n * height, width, stack.shape[3]), cv.COLOR_RGB2GRAY, out.reshape(n * height, width))
+        return out
+
+    @staticmethod
+    def binary_thresholding(stack, thresh, out=None):
+        stack = _gray_stack(stack)
+        return _apply_table(stack, _threshold_table(thresh), out)
+
+    @staticmethod
+    def otsu(stack, out=None):
+        """every image thresholded at its own Otsu threshold"""
+        stack = _gray_stack(stack)
+        thresholds = _otsu_thresholds(Batch.compute_histogram(stack))
+        if out is None:
+            out = np.empty(stack.shape, np.uint8)
+        np.greater(stack, thresholds[:, np.newaxis, np.newaxis], out=out)
+        return np.multiply(out, 255, out=out)
+
+    @staticmethod
+    def niblack(stack, kernel, k, out=None):
+        return _local_thresholds(stack, kernel, lambda local: _niblack_threshold(local, k), out)
+
+    @staticmethod
+    def sauvola(stack, kernel, k=0.5, r=128, out=None):
+        return _local_thresholds(stack, kernel, lambda local: local.sauvola(k, r), out)
+
+    @staticmethod
+    def wolf(stack, kernel, k=0.5, out=None):
+        return _local_thresholds(stack, kernel, lambda local: local.wolf(k), out)
+
+    @staticmethod
+    def phansalkar(stack, kernel, k=0.25, p=2.0, q=10.0, r=0.5, out=None):
+        return _local_thresholds(stack, kernel, lambda local: local.phansalkar(k, p, q, r), out)
+
+
+#values processed at a time by Batch operations needing temporaries larger than the stack
+BATCH_CHUNK_PIXELS = 1 << 22
+#images of at least this many values get their own lookup table call instead of a gather
+BATCH_LUT_PIXELS = 1024
+
+def _image_chunks(stack, pixels=BATCH_CHUNK_PIXELS):
+    """slices of whole images along the first axis holding about pixels values each"""
+    step = max(1, pixels // max(stack[0].size, 1)) if len(stack) else 1
+    return [slice(start, start + step) for start in range(0, len(stack), step)]
+
+def _gray_stack(stack):
+    stack = as_array(stack)
+    if len(stack.shape) != 3:
+        raise GrayscaleConversionError('Images need to be converted to grayscale')
+    return stack
+
+def _color_stack(stack):
+    stack = as_array(stack)
+    if len(stack.shape) != 4:
+        raise ValueError('Expected an (N, H, W, C) stack of color images, got shape {}'.format(stack.shape))
+    return stack
+
+def _stack_histograms(stack):
+    """(N, 256) histograms as one two-dimensional histogram of (image index, value), N is at most 256"""
+    n = len(stack)
+    rows = stack.reshape(n * stack.shape[1], -1)
+    index = np.repeat(np.arange(n, dtype=np.uint8), stack[0].size).reshape(rows.shape)
+    return cv.calcHist([rows, index], [1, 0], None, [n, 256], [0, n, 0, 256]).astype(np.int64)
+
+def _apply_table(stack, table, out=None):
+    """one lookup table applied to the whole stack in a single call"""
+    if out is None:
+        out = np.empty(stack.shape, np.uint8)
+    if len(stack) == 0:
+        return out
+    cv.LUT(stack.reshape(len(stack), -1), table, out.reshape(len(stack), -1))
+    return out
+
+def _apply_tables(stack, tables, out=None):
+    """table i of the (N, 256) tables applied to image i, as one gather from the concatenated tables"""
+    if out is None:
+        out = np.empty(stack.shape, np.uint8)
+    if len(stack) == 0:
+        return out
+    tables = np.ascontiguousarray(tables, np.uint8)
+    if stack[0].size >= BATCH_LUT_PIXELS:
+        #larger images amortize the call, cv.LUT is faster than gathering through intp indices
+        for image, table, result in zip(stack, tables, out):
+            cv.LUT(image, table, result)
+        return out
+    flat_tables = tables.ravel()
+    for chunk in _image_chunks(stack):
+        images = stack[chunk].reshape(len(stack[chunk]), -1)
+        codes = images + (np.arange(chunk.start, chunk.start + len(images), dtype=np.intp) * 256)[:, np.newaxis]
+        out[chunk] = np.take(flat_tables, codes).reshape(out[chunk].shape)
+    return out
+
+def _otsu_thresholds(hists):
+    """Otsu threshold of every row of the (N, 256) histograms, the first maximum of the between-class
+    variance like cv.THRESH_OTSU"""
+    p = hists / np.sum(hists, axis=1, keepdims=True)
+    q1 = np.cumsum(p, axis=1)
+    p *= np.arange(256)
+    m1 = np.cumsum(p, axis=1)
+    q2 = np.subtract(1, q1)
+    eps = np.finfo(np.float32).eps
+    valid = np.minimum(q1, q2) >= eps
+    valid &= np.maximum(q1, q2) <= 1 - eps
+    #q1 * q2 * (mu1 - mu2) ** 2 with mu1 = m1 / q1 and mu2 = (mu - m1) / q2
+    sigma = q1 * m1[:, -1:]
+    sigma -= m1
+    np.square(sigma, out=sigma)
+    q1 *= q2
+    np.divide(sigma, q1, out=sigma, where=valid)
+    sigma[~valid] = 0
+    return np.argmax(sigma, axis=1)
+
+def _local_thresholds(stack, kernel, threshold, out=None):
+    """binarize every image of the stack at threshold(LocalThreshold of the images), chunk by chunk"""
+    stack = _gray_stack(stack)
+    if out is None:
+        out = np.empty(stack.shape, np.uint8)
+    #integral images need two float64 tables per pixel
+    for chunk in _image_chunks(stack, BATCH_CHUNK_PIXELS // 4):
+        local = LocalThreshold(stack[chunk], kernel, stack=True)
+        local.binarize(threshold(local), out[chunk])
+    return out
+
+
+class PointPipeline:
+    """chain of intensity mappings applied to the image as one composed lookup table
+
+    usage example:
+        PointPipeline().normalize(0, 255).gamma(0.8).threshold(127).apply(img)
+    """
+    def __init__(self):
+        self.steps = []
+
+    def gamma(self, gamma):
+        self.steps.append((_gamma_table, (gamma,)))
+        return self
+
+    def threshold(self, thresh):
+        self.steps.append((_threshold_table, (thresh,)))
+        return self
+
+    def normalize(self, a, b):
+        #min and max of the image are known only when the pipeline is applied
+        self.steps.append((_normalize_table, (a, b)))
+        return self
+
+    def equalize(self):
+        self.steps.append((_equalize_table, ()))
+        return self
+
+    def table(self, img):
+        """compose all steps into a single 256 entry table for the given image"""
+        image = np.asarray(img)
+        steps = [step for step, _ in self.steps]
+        if any(step in _GRAYSCALE_STEPS for step in steps) and len(image.shape) != 2:
+            raise GrayscaleConversionError('Image needs to be converted to grayscale')
+        if any(step in _HISTOGRAM_STEPS for step in steps):
+            source_hist = np.bincount(image.ravel(), minlength=256)
+        lut = np.arange(256, dtype=np.uint8)
+        for step, params in self.steps:
+            if step in _HISTOGRAM_STEPS:
+                #histogram of the intermediate image is the source histogram mapped through the table so far
+                hist = np.bincount(lut, weights=source_hist, minlength=256)
+                params = params + (hist.astype(np.int64),)
+            lut = step(*params)[lut]
+        return lut
+
+    def apply(self, img, out=None):
+        image = as_array(img)
+        return cv.LUT(image, self.table(image), out)
+
+
+def _read_only(table):
+    table.flags.writeable = False
+    return table
+
+@lru_cache(maxsize=256)
+def _gamma_table(gamma):
+    table = np.clip(np.power(np.arange(256) / 255.0, gamma) * 255.0, 0, 255)
+    return _read_only(table.astype(np.uint8))
+
+@lru_cache(maxsize=256)
+def _threshold_table(thresh):
+    table = np.where(np.arange(256) > thresh, 255, 0)
+    return _read_only(table.astype(np.uint8))
+
+#tables of the histogram steps depend on the image, they are not cached
+def _normalize_table(a, b, hist):
+    present = np.flatnonzero(hist)
+    return _normalize_tables(a, b, present[:1], present[-1:])[0]
+
+def _equalize_table(hist):
+    return _equalize_tables([hist])[0]
+
+def _normalize_tables(a, b, low, high):
+    """(N, 256) tables stretching [low[i], high[i]] to [min(a, b), max(a, b)], with the float32 arithmetic
+    of cv.normalize so results are identical"""
+    low = np.asarray(low, np.float64)[:, np.newaxis]
+    high = np.asarray(high, np.float64)[:, np.newaxis]
+    spread = high > low
+    scale = (max(a, b) - min(a, b)) * np.divide(1.0, high - low, out=np.zeros_like(low), where=spread)
+    shift = min(a, b) - low * scale
+    #float32 factors multiplied and added in double, the result rounded to float32 and then to the nearest even
+    table = np.arange(256) * scale.astype(np.float32).astype(np.float64) + shift.astype(np.float32)
+    return np.clip(np.rint(table.astype(np.float32)), 0, 255).astype(np.uint8)
+
+def _equalize_tables(hists):
+    """(N, 256) tables equalizing every row of the histograms, with the float32 arithmetic of cv.equalizeHist"""
+    hists = np.asarray(hists, np.int64)
+    first = np.argmax(hists > 0, axis=1)[:, np.newaxis]
+    first_count = np.take_along_axis(hists, first, axis=1)
+    total = hists.sum(axis=1, keepdims=True)
+    single = first_count == total
+    scale = np.float32(255) / np.where(single, 1, total - first_count).astype(np.float32)
+    table = np.rint((np.cumsum(hists, axis=1) - first_count).astype(np.float32) * scale)
+    table[np.arange(256) < first] = 0
+    #images of a single value keep it
+    table = np.where(single, first, table)
+    return np.clip(table, 0, 255).astype(np.uint8)
+
+_HISTOGRAM_STEPS = (_normalize_table, _equalize_table)
+#steps only defined for grayscale images, threshold raises like Binarization.binary_thresholding
+_GRAYSCALE_STEPS = (_threshold_table, _equalize_table)
 
 
 class Filter:
@@ -213,62 +637,317 @@ class Filter:
 
         ])
 
+    #compass kernels ordered 0, 45, ..., 315 degrees
+    prewitt_bank = filters[1:9]
+    sobel_bank = filters[9:17]
+
+    @staticmethod
+    def median(img, kernel, out=None):
+          image = as_array(img)
+          return cv.medianBlur(image, kernel, out)
+
     @staticmethod
-    def median(img, kernel):
-          image = np.array(img)
-          return cv.medianBlur(image, kernel)
+    def percentile_filter(img, kernel, percentile, out=None, progress=None):
+        """percentile of every kernel x kernel window of a uint8 image (0 is the minimum, 50 the median,
+        100 the maximum), channels are filtered separately and borders are replicated like in median"""
+        return Filter.percentile_filters(img, kernel, [percentile], None if out is None else [out], progress)[0]
 
     @staticmethod
-    def linear_filter(img, kernel):
-        image = np.array(img)
-        return cv.filter2D(image,-1,kernel)
+    def percentile_filters(img, kernel, percentiles, out=None, progress=None):
+        """list of percentile_filter results, the sliding histograms are shared by all percentiles;
+        progress is called with the finished fraction while they move down the image and may raise to stop"""
+        image = as_array(img)
+        if image.dtype != np.uint8:
+            raise TypeError('percentile filters need a uint8 image, got {}'.format(image.dtype))
+        if out is None:
+            out = [None] * len(percentiles)
+        area = kernel * kernel
+        ranks = [int(round(percentile / 100 * (area - 1))) for percentile in percentiles]
+        results = [None] * len(ranks)
+        counted = []
+        for i, rank in enumerate(ranks):
+            if rank == 0:
+                results[i] = cv.erode(image, np.ones((kernel, kernel), np.uint8), out[i],
+                                      borderType=cv.BORDER_REPLICATE)
+            elif rank == area - 1:
+                results[i] = cv.dilate(image, np.ones((kernel, kernel), np.uint8), out[i],
+                                       borderType=cv.BORDER_REPLICATE)
+            elif rank == area // 2:
+                results[i] = cv.medianBlur(image, kernel, out[i])
+            else:
+                results[i] = out[i] if out[i] is not None else np.empty_like(image)
+                counted.append(i)
+        if counted:
+            channels = image.reshape(image.shape[:2] + (-1,))
+            for c in range(channels.shape[2]):
+                report = None
+                if progress is not None:
+                    report = lambda fraction, c=c: progress((c + fraction) / channels.shape[2])
+                ranked = _rank_filter(np.ascontiguousarray(channels[:, :, c]), kernel, [ranks[i] for i in counted],
+                                      report)
+                for i, result in zip(counted, ranked):
+                    results[i].reshape(channels.shape)[:, :, c] = result
+        return results
 
     @staticmethod
-    def box_blur(img):
-        image = np.array(img)
+    def linear_filter(img, kernel, out=None):
+        image = as_array(img)
+        kernel = np.asarray(kernel, np.float32)
+        factors = _separable_factors(kernel.tobytes(), kernel.shape)
+        if factors is not None:
+            #rank-1 kernel, two 1-D passes instead of a dense 2-D one
+            kernel_x, kernel_y = factors
+            return cv.sepFilter2D(image,-1,kernel_x,kernel_y,out)
+        return cv.filter2D(image,-1,kernel,out)
+
+    @staticmethod
+    def filter_bank(img, kernels, band_height=256):
+        """strongest response of a set of kernels (saturated to uint8 like linear_filter) and the index of the
+        kernel giving it, kernels that are negations of earlier ones reuse their convolution"""
+        image = as_array(img)
+        kernels = np.asarray(kernels, np.float32)
+        #(convolution, sign) of every kernel
+        bases = []
+        plan = []
+        for kernel in kernels:
+            for i, base in enumerate(bases):
+                if np.array_equal(kernel, base):
+                    plan.append((i, 1))
+                    break
+                if np.array_equal(kernel, -base):
+                    plan.append((i, -1))
+                    break
+            else:
+                bases.append(kernel)
+                plan.append((len(bases) - 1, 1))
+        radius = max(kernels.shape[1:]) // 2
+        height = image.shape[0]
+        magnitude = np.empty(image.shape, np.uint8)
+        orientation = np.empty(image.shape, np.uint8)
+        #bands with a halo of the kernel radius, temporaries never exceed one band
+        for top in range(0, height, band_height):
+            bottom = min(top + band_height, height)
+            y0, y1 = max(top - radius, 0), min(bottom + radius, height)
+            band = image[y0:y1]
+            responses = [_filter_response(band, base)[top - y0:bottom - y0] for base in bases]
+            best = np.full(responses[0].shape, -np.inf, np.float32)
+            best_index = np.zeros(responses[0].shape, np.uint8)
+            for index, (i, sign) in enumerate(plan):
+                response = responses[i] if sign > 0 else np.negative(responses[i])
+                better = response > best
+                np.copyto(best, response, where=better)
+                np.copyto(best_index, index, where=better)
+            magnitude[top:bottom] = np.clip(np.rint(best), 0, 255)
+            orientation[top:bottom] = best_index
+        return magnitude, orientation
+
+    @staticmethod
+    def box_blur(img, out=None):
         kernel = np.ones((3,3),np.float32)/9
-        return cv.filter2D(image,-1,kernel)
+        return Filter.linear_filter(img, kernel, out)
         
     @staticmethod
-    def gaussian_blur(img):
-        image = np.array(img)
-        return cv.GaussianBlur(image,(5,5),0)
+    def gaussian_blur(img, out=None):
+        image = as_array(img)
+        return cv.GaussianBlur(image,(5,5),0,out)
 
     @staticmethod
-    def kuwahara_filter(img, kernel):
-        image = np.array(img)
+    def kuwahara_filter(img, kernel, out=None):
+        image = as_array(img)
         shift = int((kernel + 1) / 2)
-        height =  image.shape[0] - kernel
-        width = image.shape[1] - kernel
-        channels = image.shape[2]
-        for y in range(height):
-            for x in range(width):
-                #devide into 4 regions
-                region_NW = image[y:y+shift,x:x+shift,:]
-                region_NE = image[y:y+shift,x+shift-1:x+kernel,:]
-                region_SW = image[y+shift-1:y+kernel,x:x+shift,:]
-                region_SE = image[y+shift-1:y+kernel,x+shift-1:x+kernel,:]
-                
-                #calculate avg and variance
-                avg = []
-                var = []
-                avg.append(np.average(np.average(region_NW,1),0))
-                var.append(np.var(region_NW))
-                avg.append(np.average(np.average(region_NE,1),0))
-                var.append(np.var(region_NE))
-                avg.append(np.average(np.average(region_SW,1),0))
-                var.append(np.var(region_SW))
-                avg.append(np.average(np.average(region_SE,1),0))
-                var.append(np.var(region_SE))
-               
-
-                #find minimum variance
-                min_var_reg = int(np.argmin(np.array(var)))
-                #print(min_var_reg)
-                
-                #result is avg of min var region
-                for channel in range(channels):
-                    image[y+shift-1,x+shift-1,channel] = avg[min_var_reg][channel]
-        return image
+        height, width = image.shape[:2]
+        if out is None:
+            result = image.copy()
+        else:
+            result = out
+            if result is not image:
+                result[:] = image
+        if height < kernel or width < kernel:
+            return result
+        #sums of every shift x shift window taken from summed-area tables
+        integral, sq_integral = (table.reshape(table.shape[:2] + (-1,)) for table in _integrals(image, 0, 0))
+        window_sum, window_sqsum = _box_sum(integral, shift), _box_sum(sq_integral, shift)
+        channels = window_sum.shape[2]
+        area = shift * shift
+        #region anchors of every filtered pixel
+        rows = height - shift + 1
+        cols = width - shift + 1
+        north = slice(0, rows - shift + 1)
+        south = slice(shift - 1, rows)
+        west = slice(0, cols - shift + 1)
+        east = slice(shift - 1, cols)
+        regions = [(north, west), (north, east), (south, west), (south, east)]  #NW, NE, SW, SE
+        #calculate avg and variance of each region
+        avg = np.stack([window_sum[r, c] / area for r, c in regions])
+        var = np.stack([window_sqsum[r, c].sum(axis=2) / (area * channels) for r, c in regions])
+        var -= (avg.sum(axis=3) / channels) ** 2
+        #result is avg of min var region
+        min_var_reg = np.argmin(var, axis=0)
+        output = np.take_along_axis(avg, min_var_reg[np.newaxis, :, :, np.newaxis], axis=0)[0]
+        output = output.reshape(output.shape[:2] + image.shape[2:])
+        result[shift-1:height-shift+1, shift-1:width-shift+1] = output.astype(image.dtype)
+        return result
+
+
+def _filter_response(image, kernel):
+    """unsaturated float32 correlation of image with kernel"""
+    factors = _separable_factors(kernel.tobytes(), kernel.shape)
+    if factors is not None:
+        return cv.sepFilter2D(image, cv.CV_32F, factors[0], factors[1])
+    return cv.filter2D(image, cv.CV_32F, kernel)
+
+@lru_cache(maxsize=256)
+def _separable_factors(kernel_bytes, shape):
+    """(kernel_x, kernel_y) with kernel == outer(kernel_y, kernel_x) for rank-1 kernels, None otherwise"""
+    kernel = np.frombuffer(kernel_bytes, np.float32).reshape(shape).astype(np.float64)
+    if min(shape) < 2 or not kernel.any():
+        return None
+    singular = np.linalg.svd(kernel, compute_uv=False)
+    if singular[1] > singular[0] * 1e-6:
+        return None
+    #factor through the largest entry, exact for the integer kernels of the filter bank
+    row, column = np.unravel_index(np.argmax(np.abs(kernel)), shape)
+    kernel_x = kernel[row, :]
+    kernel_y = kernel[:, column] / kernel[row, column]
+    if not np.allclose(np.outer(kernel_y, kernel_x), kernel, rtol=0, atol=1e-6):
+        return None
+    return kernel_x.astype(np.float32), kernel_y.astype(np.float32)
+
+
+#window columns of all row bands whose histograms _rank_filter keeps at a time, 256 counts each
+RANK_FILTER_COLUMNS = 1 << 15
+
+def _rank_filter(image, size, ranks, progress=None):
+    """value of the given ranks (0 is the smallest) in every size x size window of a 2-D uint8 image,
+    progress is called with the finished fraction after every row of the bands
+
+    Two-level sliding histograms (Perreault-Hebert): the high nibble of a rank comes from _coarse_ranks, the low
+    nibble from the 16 bins of that coarse bin. Histograms of every column over the window height are moved down
+    one row at a time, in many row bands at once. Along a row the window histogram of a coarse bin changes by the
+    column entering the window minus the column leaving it, it is only summed from all its columns where the
+    coarse bin of the rank changes, so the cost per pixel does not depend on the window size.
+    """
+    height, width = image.shape
+    coarse, below = _coarse_ranks(image, size, ranks)
+    radius = size // 2
+    columns = width + size - 1
+    band = max(-(-height * columns // RANK_FILTER_COLUMNS), size)
+    bands = -(-height // band)
+    padding = bands * band - height
+    source = cv.copyMakeBorder(image, radius, radius + padding, radius, radius, cv.BORDER_REPLICATE)
+    coarse = [np.pad(high, ((0, padding), (0, 0)), 'constant') for high in coarse]
+    below = [np.pad(count, ((0, padding), (0, 0)), 'constant') for count in below]
+    results = [np.empty((bands * band, width), np.uint8) for _ in ranks]
+
+    #column counts plus size stay unsigned
+    dtype = np.uint8 if 2 * size <= np.iinfo(np.uint8).max else np.uint16
+    #histogram of every column over the window height, ordered by band, coarse bin, column and fine bin, so the
+    #16 fine bins of a column are one block and the blocks of the columns of a coarse bin are next to each other
+    histograms = np.zeros(bands * 16 * columns * 16, dtype)
+    blocks = histograms.view(np.dtype((np.void, 16 * histograms.itemsize)))
+    tops = np.arange(bands) * band
+    bins = (np.arange(bands)[:, None] * 16 * columns + np.arange(columns)) * 16
+    values = np.arange(256)
+    value_bins = (values >> 4) * columns * 16 + (values & 15)
+    windows = bands * width
+    #block of the first column of every window in coarse bin 0, and the size times its column
+    first = (np.arange(bands)[:, None] * 16 * columns + np.arange(width)).ravel()
+    edges = (size * np.tile(np.arange(width), bands)).astype(np.int32)
+    for row in range(size - 1):
+        _count(histograms, bins + value_bins.take(source[tops + row]), np.add)
+    for row in range(band):
+        _count(histograms, bins + value_bins.take(source[tops + row + size - 1]), np.add)
+        for rank, rank_coarse, rank_below, result in zip(ranks, coarse, below, results):
+            high = rank_coarse[tops + row].ravel()
+            block = first + high.astype(np.intp) * columns
+            #counts of the coarse bin in the column entering the window minus the column leaving it, plus size
+            steps = blocks[block + size - 1].view(dtype).reshape(windows, 16)
+            steps += size
+            steps -= blocks[block - 1].view(dtype).reshape(windows, 16)
+            #runs of the same coarse bin along the rows start from the sum of all window columns
+            starts = np.ones(windows, bool)
+            np.not_equal(high[1:], high[:-1], out=starts[1:])
+            starts[::width] = True
+            steps[starts] = size
+            start_blocks = block[starts]
+            start_counts = blocks[start_blocks].view(dtype).reshape(-1, 16).astype(np.int32)
+            for column in range(1, size):
+                start_counts += blocks[start_blocks + column].view(dtype).reshape(-1, 16)
+            #running sums of the steps, one row per fine bin
+            steps = cv.transpose(steps)
+            if dtype == np.uint8:
+                sums = cv.integral(steps, sdepth=cv.CV_32S)
+                sums = sums[1:, 1:] - sums[:-1, 1:]
+            else:
+                sums = np.cumsum(steps, axis=1, dtype=np.int32)
+            offsets = start_counts.T - sums[:, starts] + edges[starts]
+            counts = sums - edges
+            counts += np.repeat(offsets, np.diff(np.flatnonzero(starts), append=windows), axis=1)
+            #the low nibble is the number of fine bins whose cumulative count stays within the rank
+            left = (rank - rank_below[tops + row]).ravel()
+            total = counts[0]
+            low = (total <= left).astype(np.uint8)
+            for fine in range(1, 16):
+                total += counts[fine]
+                low += total <= left
+            result[tops + row] = (high * 16 + low).reshape(bands, width)
+        _count(histograms, bins + value_bins.take(source[tops + row]), np.subtract)
+        if progress is not None:
+            progress((row + 1) / band)
+    return [result[:height] for result in results]
+
+def _coarse_ranks(image, size, ranks):
+    """high nibble of the given ranks in every size x size window of a 2-D uint8 image and the number of window
+    pixels below it, from the box counts of the pixels below every multiple of 16 (threshold decomposition)"""
+    depth = cv.CV_16U if size * size <= np.iinfo(np.uint16).max else cv.CV_32S
+    coarse = [np.zeros(image.shape, np.uint8) for _ in ranks]
+    below = [np.zeros(image.shape, np.int32) for _ in ranks]
+    plane = np.empty(image.shape, np.uint8)
+    count = None
+    for level in range(16, 256, 16):
+        cv.threshold(image, level - 1, 1, cv.THRESH_BINARY_INV, plane)
+        count = cv.boxFilter(plane, depth, (size, size), count, normalize=False, borderType=cv.BORDER_REPLICATE)
+        if count.min() > max(ranks):
+            #every rank is settled below this level
+            break
+        for rank, high, low_count in zip(ranks, coarse, below):
+            above = count <= rank
+            high += above
+            np.copyto(low_count, count, where=above)
+    return coarse, below
+
+def _count(histograms, index, update):
+    #the indices of one call are distinct, so a plain read-modify-write counts them all
+    np.put(histograms, index, update(histograms.take(index), 1))
+
+
+def _box_sum(table, size):
+    """sums of every size x size window from a summed-area table"""
+    result = table[size:, size:] - table[:-size, size:]
+    result -= table[size:, :-size]
+    result += table[:-size, :-size]
+    return result
+
+def _stacked_box_sum(table, size, n, stride, height):
+    """(n, height, W) sums of size x size windows from the summed-area table of n images stacked every stride rows,
+    windows straddling two images are skipped"""
+    row, column = table.strides
+    top, bottom = (np.lib.stride_tricks.as_strided(rows, (n, height, table.shape[1]), (stride * row, row, column))
+                   for rows in (table, table[size:]))
+    rows = bottom - top
+    return rows[..., size:] - rows[..., :-size]
 
+def _integrals(image, before, after):
+    """integral and squared integral images (float64) of the image with a replicated border, not kept in
+    derived_cache as the windowed operations run on untracked row bands and tiles"""
+    if before or after:
+        image = cv.copyMakeBorder(image, before, after, before, after, cv.BORDER_REPLICATE)
+    return cv.integral2(image, sdepth=cv.CV_64F, sqdepth=cv.CV_64F)
 
+_REPRESENTATIONS = {
+    'gray': lambda image: cv.cvtColor(image, cv.COLOR_RGB2GRAY),
+    'ycrcb': lambda image: cv.cvtColor(image, cv.COLOR_RGB2YCrCb),
+    'histograms': lambda image: Histogram.compute_histograms(image),
+    #every level from the one above it, so the levels on the way are cached as well
+    'pyramid': lambda image, level: Conversion.pyramid_down(image if level == 1 else representation(image, 'pyramid', level - 1)),
+}
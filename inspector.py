@@ -0,0 +1,105 @@
+"""pixel readout under the mouse cursor
+
+Motion events only record the cursor position, the readout is refreshed at
+most once per display frame from the current numpy image. The neighbourhood
+mean and standard deviation come from integral images of the row band under
+the cursor, built once per band and image version.
+"""
+from collections import OrderedDict
+
+import numpy as np
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+from PyQt5.QtWidgets import QApplication
+
+#OpenCV is loaded on first use, not before the window is shown
+from image_processing import cv
+
+#the neighbourhood is (2 * radius + 1) pixels square, clipped at the image border
+NEIGHBOURHOOD_RADIUS = 2
+#rows of image covered by one pair of integral images, and the bands kept
+BAND_HEIGHT = 64
+MAX_BANDS = 8
+#used when the screen does not report its refresh rate
+DEFAULT_REFRESH_RATE = 60
+
+
+class NeighbourhoodStats:
+    """mean and standard deviation per channel of the window around a pixel, from integral images of row bands"""
+    def __init__(self, radius=NEIGHBOURHOOD_RADIUS, band_height=BAND_HEIGHT, max_bands=MAX_BANDS):
+        self.radius = radius
+        self.band_height = band_height
+        self.max_bands = max_bands
+        self._bands = OrderedDict()
+        self._version = None
+
+    def at(self, image, version, x, y):
+        """(mean, std) arrays with one value per channel of the window centred on column x, row y"""
+        top, integral, sq_integral = self._band(image, version, y // self.band_height)
+        height, width = image.shape[:2]
+        #window corners relative to the band
+        y0, y1 = max(y - self.radius, 0) - top, min(y + self.radius + 1, height) - top
+        x0, x1 = max(x - self.radius, 0), min(x + self.radius + 1, width)
+        count = (y1 - y0) * (x1 - x0)
+        mean = _window_sum(integral, y0, y1, x0, x1) / count
+        variance = _window_sum(sq_integral, y0, y1, x0, x1) / count - np.square(mean)
+        return mean, np.sqrt(np.maximum(variance, 0))
+
+    def _band(self, image, version, band):
+        if version != self._version:
+            self._bands.clear()
+            self._version = version
+        if band in self._bands:
+            self._bands.move_to_end(band)
+            return self._bands[band]
+        #rows of the band with the halo the windows of its border rows reach
+        top = max(band * self.band_height - self.radius, 0)
+        bottom = min((band + 1) * self.band_height + self.radius, image.shape[0])
+        integral, sq_integral = cv.integral2(np.ascontiguousarray(image[top:bottom]),
+                                             sdepth=cv.CV_64F, sqdepth=cv.CV_64F)
+        self._bands[band] = top, integral, sq_integral
+        if len(self._bands) > self.max_bands:
+            self._bands.popitem(last=False)
+        return self._bands[band]
+
+
+def _window_sum(table, y0, y1, x0, x1):
+    return np.atleast_1d(table[y1, x1] - table[y0, x1] - table[y1, x0] + table[y0, x0])
+
+
+class PixelInspector(QObject):
+    """coalesces cursor positions to one readout per display frame,
+    probed is emitted with (x, y, value, mean, std) where value is the RGB tuple of the pixel"""
+    probed = pyqtSignal(int, int, tuple, object, object)
+
+    def __init__(self, source_image, parent=None):
+        super(PixelInspector, self).__init__(parent)
+        self.source_image = source_image
+        self.stats = NeighbourhoodStats()
+        self.x = self.y = None
+
+        screen = QApplication.primaryScreen()
+        refresh_rate = screen.refreshRate() if screen is not None else 0
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(int(1000 / (refresh_rate or DEFAULT_REFRESH_RATE)))
+        self.timer.timeout.connect(self.read)
+
+    def probe(self, x, y):
+        """remember the cursor position, the readout follows within one frame"""
+        self.x, self.y = x, y
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def refresh(self):
+        """read the last position again, after the image changed"""
+        if self.x is not None and not self.timer.isActive():
+            self.timer.start()
+
+    def read(self):
+        image = self.source_image.img
+        if image is None or self.x is None:
+            return
+        height, width = image.shape[:2]
+        x, y = min(max(self.x, 0), width - 1), min(max(self.y, 0), height - 1)
+        mean, std = self.stats.at(image, self.source_image.version, x, y)
+        self.probed.emit(x, y, tuple(int(v) for v in self.source_image.pixel(x, y)), mean, std)
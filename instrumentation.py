@@ -0,0 +1,199 @@
+"""opt-in timing and memory instrumentation of image_processing operations
+
+When enabled, the static methods of the image_processing classes are replaced
+with wrappers recording every call in the metrics registry. When disabled the
+original functions are restored, so there is no overhead at all.
+
+usage example:
+    instrumentation.enable()
+    ...
+    print(instrumentation.registry.to_prometheus())
+"""
+import json
+import threading
+import time
+import tracemalloc
+from collections import deque
+from functools import wraps
+
+import numpy as np
+
+import image_processing
+
+INSTRUMENTED_CLASSES = [
+    image_processing.Histogram,
+    image_processing.Brightness,
+    image_processing.Conversion,
+    image_processing.Binarization,
+    image_processing.Filter,
+    image_processing.Batch,
+]
+
+#number of individual calls kept, aggregates cover all calls
+MAX_RECORDS = 10000
+
+
+def _describe(value):
+    if isinstance(value, np.ndarray):
+        return {'shape': list(value.shape), 'dtype': str(value.dtype)}
+    if isinstance(value, (int, float, str, bool)) or value is None:
+        return value
+    return repr(value)
+
+
+class MetricsRegistry:
+    def __init__(self, max_records=MAX_RECORDS):
+        self.records = deque(maxlen=max_records)
+        self.totals = {}
+        self.lock = threading.Lock()
+
+    def record(self, operation, wall, cpu, allocated, image=None, result=None, params=()):
+        """allocated is None when it was not measured, the record and the totals then leave it out"""
+        record = {
+            'operation': operation,
+            'wall_seconds': wall,
+            'cpu_seconds': cpu,
+            'input': _describe(np.asarray(image)) if image is not None else None,
+            'output': _describe(result) if isinstance(result, np.ndarray) else None,
+            'params': [_describe(param) for param in params],
+        }
+        if allocated is not None:
+            record['allocated_bytes'] = allocated
+        with self.lock:
+            self.records.append(record)
+            total = self.totals.setdefault(operation, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0})
+            total['calls'] += 1
+            total['wall_seconds'] += wall
+            total['cpu_seconds'] += cpu
+            if allocated is not None:
+                total['allocated_bytes'] = total.get('allocated_bytes', 0) + allocated
+        return record
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+            self.totals.clear()
+
+    def to_json(self):
+        with self.lock:
+            return json.dumps({'totals': self.totals, 'records': list(self.records)}, indent=2)
+
+    def to_prometheus(self):
+        metrics = [
+            ('image_operation_calls_total', 'counter', 'Number of calls', 'calls'),
+            ('image_operation_wall_seconds_total', 'counter', 'Wall time spent in the operation', 'wall_seconds'),
+            ('image_operation_cpu_seconds_total', 'counter', 'CPU time of the calling thread', 'cpu_seconds'),
+            ('image_operation_allocated_bytes_total', 'counter', 'Bytes allocated by the operation', 'allocated_bytes'),
+        ]
+        lines = []
+        with self.lock:
+            for metric, kind, help_text, key in metrics:
+                lines.append('# HELP {} {}'.format(metric, help_text))
+                lines.append('# TYPE {} {}'.format(metric, kind))
+                for operation, total in sorted(self.totals.items()):
+                    if key not in total:
+                        continue
+                    lines.append('{}{{operation="{}"}} {}'.format(metric, operation, total[key]))
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        """write the registry as Prometheus text for .prom files, JSON otherwise"""
+        text = self.to_prometheus() if str(path).endswith('.prom') else self.to_json()
+        with open(path, 'w') as f:
+            f.write(text)
+
+
+registry = MetricsRegistry()
+_originals = {}
+_track_memory = False
+#whether enable started tracemalloc, which is then stopped by disable
+_started_tracing = False
+#depth of nested instrumented calls of every thread
+_local = threading.local()
+#reset_peak is new in Python 3.9, clearing the traces also restarts the peak
+_reset_peak = getattr(tracemalloc, 'reset_peak', tracemalloc.clear_traces)
+
+
+def is_enabled():
+    return bool(_originals)
+
+
+def _measure(call, traced):
+    """result of call() with its wall and cpu seconds and, when traced, the peak of traced memory above the start"""
+    if traced:
+        _reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+    wall, cpu = time.perf_counter(), time.thread_time()
+    result = call()
+    wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+    allocated = None
+    if traced:
+        _, peak = tracemalloc.get_traced_memory()
+        allocated = max(peak - start, 0)
+    return result, wall, cpu, allocated
+
+
+def measure(call):
+    """(result, wall seconds, cpu seconds, allocated bytes) of call(), allocated is None without memory tracking;
+    instrumented calls inside it restart the peak, so it covers the time from the last of them on"""
+    return _measure(call, _track_memory and tracemalloc.is_tracing())
+
+
+def observe(operation, image, params, call):
+    """run call() and record it under the operation name;
+    with memory tracking the peak of traced memory is measured for the outermost instrumented call of the thread,
+    tracemalloc is process-wide so calls running concurrently on other threads make the numbers approximate"""
+    depth = getattr(_local, 'depth', 0)
+    _local.depth = depth + 1
+    try:
+        result, wall, cpu, allocated = _measure(call, _track_memory and depth == 0 and tracemalloc.is_tracing())
+    finally:
+        _local.depth = depth
+    if allocated is None:
+        #without tracing (and inside an outer traced call), the new result array is the allocation estimate
+        allocated = result.nbytes if isinstance(result, np.ndarray) and result is not image else 0
+    registry.record(operation, wall, cpu, allocated, image, result, params)
+    return result
+
+
+def instrumented(function, operation):
+    @wraps(function)
+    def wrapper(img, *params, **kwargs):
+        return observe(operation, img, params, lambda: function(img, *params, **kwargs))
+    return wrapper
+
+
+def unwrap(function):
+    return getattr(function, '__wrapped__', function)
+
+
+def enable(track_memory=False):
+    """wrap image_processing operations, track_memory traces allocations at a noticeable cost
+    from now until disable"""
+    global _track_memory, _started_tracing
+    _track_memory = track_memory
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracing = True
+    elif not track_memory and _started_tracing:
+        tracemalloc.stop()
+        _started_tracing = False
+    if is_enabled():
+        return
+    for cls in INSTRUMENTED_CLASSES:
+        for name, attribute in list(vars(cls).items()):
+            if isinstance(attribute, staticmethod):
+                _originals[(cls, name)] = attribute
+                operation = '{}.{}'.format(cls.__name__, name)
+                setattr(cls, name, staticmethod(instrumented(attribute.__func__, operation)))
+
+
+def disable():
+    global _track_memory, _started_tracing
+    _track_memory = False
+    if _started_tracing:
+        tracemalloc.stop()
+        _started_tracing = False
+    for (cls, name), attribute in _originals.items():
+        setattr(cls, name, attribute)
+    _originals.clear()
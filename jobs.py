@@ -0,0 +1,149 @@
+"""background execution of image_processing operations for the Qt interface
+
+Operations run on a QThreadPool worker, results and progress are delivered
+back on the GUI thread through queued signals.
+"""
+import sys
+import time
+from collections import deque
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+import instrumentation
+from tiling import HALO_RADIUS, process_bands
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def run_with_progress(operation, image, params, progress):
+    """run operation on image, in parallel row bands when it is tile-local, which also makes progress and
+    cancellation fine grained"""
+    if instrumentation.unwrap(operation) in HALO_RADIUS:
+        #instrumented operations record every band
+        return process_bands(image, operation, *params, progress=progress)
+    progress(0.0)
+    result = operation(image, *params)
+    progress(1.0)
+    return result
+
+
+class _JobSignals(QObject):
+    progress = pyqtSignal(float)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(object)
+    cancelled = pyqtSignal()
+
+
+class Job(QRunnable):
+    def __init__(self, operation, params, on_result, on_error=None, prepare=None):
+        """prepare(image, result) runs on the worker after the operation, on_result gets its return value"""
+        super(Job, self).__init__()
+        self.setAutoDelete(False)
+        self.operation = operation
+        self.params = params
+        self.on_result = on_result
+        self.on_error = on_error
+        self.prepare = prepare
+        self.image = None
+        #version of the image when the job started
+        self.version = None
+        self.signals = _JobSignals()
+        #wall and cpu seconds spent in the worker
+        self.seconds = (0.0, 0.0)
+        #peak bytes allocated in the worker, None unless instrumentation tracks memory
+        self.allocated = None
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def report(self, fraction):
+        if self._cancelled:
+            raise JobCancelled()
+        self.signals.progress.emit(fraction)
+
+    def run(self):
+        try:
+            result, wall, cpu, self.allocated = instrumentation.measure(
+                lambda: run_with_progress(self.operation, self.image, self.params, self.report))
+            self.seconds = (wall, cpu)
+            if self.prepare is not None:
+                result = self.prepare(self.image, result)
+        except JobCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.failed.emit(e)
+        else:
+            self.signals.finished.emit(result)
+
+
+class JobQueue(QObject):
+    """runs operations on the image one at a time in submission order,
+    so every job starts from the result of the previous one; results of cancelled jobs and of jobs whose image
+    changed meanwhile (version_getter returns something else than when the job started) are dropped"""
+    progress = pyqtSignal(float)
+    busy = pyqtSignal(bool)
+    #job, wall and cpu seconds including applying the result on the GUI thread
+    timed = pyqtSignal(object, float, float)
+
+    def __init__(self, image_getter, parent=None, version_getter=None):
+        super(JobQueue, self).__init__(parent)
+        self.image_getter = image_getter
+        self.version_getter = version_getter
+        self.pool = QThreadPool.globalInstance()
+        self.pending = deque()
+        self.current = None
+
+    def submit(self, operation, *params, on_result, on_error=None, prepare=None):
+        self.pending.append(Job(operation, params, on_result, on_error, prepare))
+        if self.current is None:
+            self._start_next()
+
+    def cancel(self):
+        """drop queued jobs and stop the running one at its next progress report"""
+        self.pending.clear()
+        if self.current is not None:
+            self.current.cancel()
+
+    def _start_next(self):
+        if not self.pending:
+            self.busy.emit(False)
+            return
+        job = self.current = self.pending.popleft()
+        #the input is taken when the job starts, after the previous job has been applied
+        job.image = self.image_getter()
+        job.version = self.version_getter() if self.version_getter is not None else None
+        job.signals.progress.connect(self.progress)
+        job.signals.finished.connect(lambda result: self._finish_timed(job, result))
+        job.signals.failed.connect(lambda error: self._finish(job, job.on_error, error))
+        job.signals.cancelled.connect(lambda: self._finish(job, None, None))
+        self.busy.emit(True)
+        self.pool.start(job)
+
+    def _finish_timed(self, job, result):
+        if job.cancelled or (self.version_getter is not None and self.version_getter() != job.version):
+            #cancelled after its last progress report, or computed from an image that is no longer shown
+            self._finish(job, None, None)
+            return
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            self._finish(job, job.on_result, result)
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            self.timed.emit(job, job.seconds[0] + wall, job.seconds[1] + cpu)
+
+    def _finish(self, job, callback, value):
+        self.current = None
+        try:
+            if callback is not None:
+                callback(value)
+            elif isinstance(value, Exception):
+                sys.excepthook(type(value), value, value.__traceback__)
+        finally:
+            self._start_next()
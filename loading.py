@@ -0,0 +1,94 @@
+"""lazy loading of image files
+
+Opening a file reads only its header. A reduced-resolution copy of a page can
+be decoded right away from a JPEG draft, a reduced-resolution TIFF subfile or
+a strided read of uncompressed strips, the full-resolution page is decoded
+only when asked for. Pages of multi-page TIFFs are decoded one at a time.
+
+usage example:
+    file = ImageFile('scan.tiff')
+    preview = file.read_reduced(0, 1024)
+    image = file.read(0)
+"""
+from pathlib import Path
+
+import numpy as np
+import PIL.Image
+
+import cache
+from tiling import _raw_memmap
+
+#TIFF NewSubfileType tag and its bit marking a reduced-resolution copy of the previous page
+NEW_SUBFILE_TYPE = 254
+REDUCED_RESOLUTION = 1
+
+
+class ImageFile:
+    """header of an image file, pages are decoded on demand"""
+    def __init__(self, path):
+        self.path = Path(path)
+        #frame index and (width, height) of every full-resolution page
+        self.pages = []
+        #frame index and size of the reduced-resolution copies of every page
+        self.reduced = []
+        with PIL.Image.open(self.path) as img:
+            self.format = img.format
+            for index in range(getattr(img, 'n_frames', 1)):
+                img.seek(index)
+                tags = getattr(img, 'tag_v2', {})
+                if tags.get(NEW_SUBFILE_TYPE, 0) & REDUCED_RESOLUTION and self.pages:
+                    self.reduced[-1].append((index, img.size))
+                else:
+                    self.pages.append((index, img.size))
+                    self.reduced.append([])
+
+    def __len__(self):
+        return len(self.pages)
+
+    def shape(self, page=0):
+        width, height = self.pages[page][1]
+        return height, width, 3
+
+    def read(self, page=0):
+        """full-resolution RGB array of the page"""
+        with PIL.Image.open(self.path) as img:
+            img.seek(self.pages[page][0])
+            #np.array copies RGB images once, other modes are converted first
+            return np.array(img if img.mode == 'RGB' else img.convert('RGB'))
+
+    def read_reduced(self, page, max_side):
+        """RGB copy of the page whose longer side is about max_side or less, decoded without reading the whole
+        page, None when the file offers no cheap way to do it"""
+        index, (width, height) = self.pages[page]
+        if max(width, height) <= max_side:
+            return None
+        #smallest stored copy still covering max_side, else the largest one
+        copies = sorted(self.reduced[page], key=lambda copy: max(copy[1]))
+        if copies:
+            index = next((i for i, size in copies if max(size) >= max_side), copies[-1][0])
+            with PIL.Image.open(self.path) as img:
+                img.seek(index)
+                return np.array(img.convert('RGB'))
+        if self.format == 'JPEG':
+            with PIL.Image.open(self.path) as img:
+                scale = max(width, height) / max_side
+                img.draft('RGB', (int(width / scale), int(height / scale)))
+                return np.array(img.convert('RGB'))
+        image = _raw_memmap(self.path, index)
+        if image is not None:
+            step = -(-max(width, height) // max_side)
+            image = np.array(image[::step, ::step])
+            return np.repeat(image[:, :, np.newaxis], 3, axis=2) if image.ndim == 2 else image
+        return None
+
+
+def decode_page(image, file, page):
+    """job operation decoding the page of file or mapping it from the image cache (written when IMAGE_CACHE=1),
+    the current image it is given is not used"""
+    cached = cache.load(file.path, page)
+    if cached is not None:
+        return cached
+    image = file.read(page)
+    if cache.WRITE_CACHE:
+        cache.store(file.path, image, page)
+    return image
@@ -1,21 +1,28 @@
-from PyQt5 import uic, QtWidgets
-from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel, QWidget, QMessageBox, QDialog, QDialogButtonBox, QSlider, QSpinBox, QDoubleSpinBox
+import startup
+from PyQt5 import QtWidgets
+from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel, QWidget, QMessageBox, QDialog, QDialogButtonBox, QSlider, QSpinBox, QDoubleSpinBox, QProgressBar, QPushButton
 from PyQt5.QtGui import QPixmap
-from PyQt5.QtCore import Qt
-
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT
-from matplotlib.backends.backend_qt5agg import FigureCanvas
-from matplotlib.figure import Figure
-from matplotlib.backend_bases import MouseButton
-import matplotlib.pyplot as plt
+from PyQt5.QtCore import Qt, pyqtSignal
+
 import numpy as np
 import sys
-import PIL.Image
+import os
+import atexit
 from pathlib import Path
-from image_processing import Histogram, Brightness, Conversion, Binarization, GrayscaleConversionError, Filter
-
-class MainWindow(QMainWindow):
+#compiled from main.ui, regenerate with: pyuic5 main.ui -o maingui.py
+from maingui import Ui_MainWindow
+from image_processing import Histogram, Brightness, Conversion, Binarization, GrayscaleConversionError, Filter, representation
+from derived import cache as derived_cache
+from jobs import JobQueue
+import instrumentation
+from history import History, make_step
+from rendering import ImageView, HistogramView, LEFT_BUTTON, create_canvas
+from preview import LivePreview
+from loading import ImageFile, decode_page
+from export import export_image, FORMATS, TIFF_COMPRESSIONS
+from inspector import PixelInspector, NEIGHBOURHOOD_RADIUS
+
+class MainWindow(QMainWindow, Ui_MainWindow):
     def __init__(self, parent=None):
         super(MainWindow, self).__init__(parent)
         self.source_image = SourceImage()
@@ -24,25 +31,6 @@ class MainWindow(QMainWindow):
         #set window title
         self.setWindowTitle("Podstawy biometrii")
 
-        #prepare image canvas
-        self.image_layout = QtWidgets.QVBoxLayout(self.matplotlibEmbedWidget)
-        self.image_canvas = FigureCanvas(Figure())
-        self.image_layout.addWidget(NavigationToolbar(self.image_canvas, self))
-        self.image_layout.addWidget(self.image_canvas)
-        self._image_ax = self.image_canvas.figure.subplots()
-
-        #prepare histogram canvas
-        self.histogram_layout = QtWidgets.QVBoxLayout(self.histogramWidget)
-        self.histogram_canvas = FigureCanvas(Figure())
-        self.histogram_layout.addWidget(NavigationToolbar(self.histogram_canvas, self))
-        self.histogram_layout.addWidget(self.histogram_canvas)
-        self._histogram_ax = self.histogram_canvas.figure.subplots()
-
-        #prepare image canvas mouse events
-        self.mouse_move_connection_id = self.image_canvas.mpl_connect('motion_notify_event', self.on_move)
-        self.image_canvas.mpl_connect('button_press_event', self.on_click)
-        self.image_canvas.mpl_connect('figure_leave_event', self.on_leave_figure)
-        
         #set r,g,b validation check events
         self.r_value.editingFinished.connect(lambda: self.on_color_change(self.r_value))
         self.g_value.editingFinished.connect(lambda: self.on_color_change(self.g_value))
@@ -51,7 +39,11 @@ class MainWindow(QMainWindow):
         #set menu actions
         self.actionOpen.triggered.connect(self.load_image)
         self.actionSave.triggered.connect(self.save_image)
+        self.actionNextPage.triggered.connect(lambda: self.change_page(1))
+        self.actionPreviousPage.triggered.connect(lambda: self.change_page(-1))
         self.actionExit.triggered.connect(self.close_app)
+        self.actionUndo.triggered.connect(self.undo)
+        self.actionRedo.triggered.connect(self.redo)
         self.actionNormalize.triggered.connect(self.normalize_histogram)
         self.actionEqualizeGrayscale.triggered.connect(self.equalize_histogram_grayscale)
         self.actionEqualizeYCrCb.triggered.connect(self.equalize_histogram_YCrCb)
@@ -70,26 +62,57 @@ class MainWindow(QMainWindow):
         #set button action
         self.update_btn.clicked.connect(self.change_rgb_value)
 
+        #pixel readout under the cursor, refreshed once per display frame
+        self.inspector = PixelInspector(self.source_image, self)
+        self.inspector.probed.connect(self.on_probed)
+        self.neighbourhood_label = QLabel()
+        self.statusbar.addPermanentWidget(self.neighbourhood_label)
+
+        #prepare background operations with progress and cancel in the status bar
+        self.jobs = JobQueue(lambda: self.source_image.img, self, lambda: self.source_image.version)
+        self.job_progress = QProgressBar()
+        self.job_progress.setMaximumWidth(200)
+        self.cancel_job_btn = QPushButton("Cancel")
+        self.statusbar.addPermanentWidget(self.job_progress)
+        self.statusbar.addPermanentWidget(self.cancel_job_btn)
+        self.on_jobs_busy(False)
+        self.jobs.busy.connect(self.on_jobs_busy)
+        self.jobs.progress.connect(lambda fraction: self.job_progress.setValue(int(fraction * 100)))
+        self.cancel_job_btn.clicked.connect(self.jobs.cancel)
+        self.jobs.timed.connect(self.on_job_timed)
+
         #set histogram checkboxes actions
         self.r_hist_checkbox.stateChanged.connect(lambda: self.on_checkbox_state_change(self.r_hist_checkbox))
         self.g_hist_checkbox.stateChanged.connect(lambda: self.on_checkbox_state_change(self.g_hist_checkbox))
         self.b_hist_checkbox.stateChanged.connect(lambda: self.on_checkbox_state_change(self.b_hist_checkbox))
         self.avg_hist_checkbox.stateChanged.connect(lambda: self.on_checkbox_state_change(self.avg_hist_checkbox))
         
+    def init_canvases(self):
+        """create the matplotlib canvases, called after the window is shown as loading matplotlib takes a while"""
+        #prepare image canvas
+        self.image_layout, self.image_canvas, self._image_ax = create_canvas(self.matplotlibEmbedWidget, self)
+        self.image_view = ImageView(self.image_canvas, self._image_ax)
+
+        #prepare histogram canvas
+        self.histogram_layout, self.histogram_canvas, self._histogram_ax = create_canvas(self.histogramWidget, self)
+        self.histogram_view = HistogramView(self.histogram_canvas, self._histogram_ax)
+
+        #prepare image canvas mouse events
+        self.mouse_move_connection_id = self.image_canvas.mpl_connect('motion_notify_event', self.on_move)
+        self.image_canvas.mpl_connect('button_press_event', self.on_click)
+        self.image_canvas.mpl_connect('figure_leave_event', self.on_leave_figure)
+
     def load_image(self):
         try:
             name, filter = QtWidgets.QFileDialog.getOpenFileName(None, "Open image file", "", "Image files (*.png *.jpg *.gif *tif *tiff *jpeg *bmp)")
             #load image
-            if name is not None:
+            if name:
                 self.source_image.path_to_image = Path(name)
                 self.source_image.image_suffix = self.source_image.path_to_image.suffix
                 self.source_image.image_stem = self.source_image.path_to_image.stem
-                self.source_image.img=PIL.Image.open(self.source_image.path_to_image)
-                self.source_image.img = self.source_image.img.convert ('RGB')
-                self.source_image.image_pixelmap = self.source_image.img.load()
-                self._image_ax.clear()
-                self._image_ax.imshow(self.source_image.img)
-                self.image_canvas.draw()
+                #only the header is read here, pixels are decoded by open_page
+                self.source_image.file = ImageFile(self.source_image.path_to_image)
+                self.open_page(0)
         except FileNotFoundError as fnfe:
             msg = QMessageBox()
             msg.setIcon(QMessageBox.Critical)
@@ -105,18 +128,48 @@ class MainWindow(QMainWindow):
             msg.setWindowTitle("File error")
             msg.exec_()
 
+    def open_page(self, page):
+        """show a reduced copy of the page right away and decode the full page in the background,
+        operations queued meanwhile run on the full page"""
+        file = self.source_image.file
+        #jobs on the previous image must not land on this one
+        self.jobs.cancel()
+        self.source_image.begin_loading(page)
+        preview = file.read_reduced(page, max(self.image_canvas.width(), self.image_canvas.height()))
+        if preview is not None:
+            self.image_view.show_reduced(preview, file.shape(page))
+            self.draw_histogram(Histogram.compute_histograms(preview))
+        self.statusbar.showMessage("Loading {}...".format(file.path.name))
+        self.jobs.submit(decode_page, file, page, on_result=self.on_page_loaded, on_error=self.on_operation_error)
+
+    def on_page_loaded(self, image):
+        self.source_image.loading = False
+        self.source_image.reset(image)
+        file = self.source_image.file
+        if len(file) > 1:
+            self.statusbar.showMessage("Page {} of {}".format(self.source_image.page + 1, len(file)), 5000)
+
+    def change_page(self, step):
+        file = self.source_image.file
+        if file is None or self.source_image.loading:
+            return
+        page = self.source_image.page + step
+        if 0 <= page < len(file):
+            self.open_page(page)
+
     def save_image(self):
         if(self.source_image.image_suffix is not None and self.source_image.image_stem is not None):
-            try:
-                image_name = self.source_image.image_stem+'_edit'
-                filename, _ = QtWidgets.QFileDialog.getSaveFileName(self, 'Save as... File', image_name , filter="png file (*.png);;jpg file (*.jpg);;jpeg file (*.jpeg);;gif file (*.gif);;tif file (*.tif);;tiff file (*.tiff);;bmp file (*.bmp)")
-                if filename is not None:
-                    try:
-                        self.source_image.img.save(Path(filename))
-                    except AttributeError:
-                        PIL.Image.fromarray(self.source_image.img).save(Path(filename))
-            except ValueError:
-                pass
+            image_name = self.source_image.image_stem+'_edit'
+            filename, _ = QtWidgets.QFileDialog.getSaveFileName(self, 'Save as... File', image_name , filter="png file (*.png);;jpg file (*.jpg);;jpeg file (*.jpeg);;gif file (*.gif);;tif file (*.tif);;tiff file (*.tiff);;bmp file (*.bmp)")
+            if filename:
+                path = Path(filename)
+                dlg = ExportDialog(path.suffix.lower().lstrip('.') or 'png', self)
+                if dlg.exec_():
+                    formats, options = dlg.get_values()
+                    #encoded in the background from the image left by the operations queued before
+                    if formats:
+                        self.jobs.submit(export_image, path.with_suffix(''), formats, options,
+                                         on_result=self.on_exported, on_error=self.on_operation_error)
         else:
             msg = QMessageBox()
             msg.setIcon(QMessageBox.Warning)
@@ -125,139 +178,187 @@ class MainWindow(QMainWindow):
             msg.setWindowTitle("Saving issue")
             msg.exec_()
 
+    def on_exported(self, results):
+        lines = ["{}: {:.1f} ms, {:.1f} kB".format(path.name, seconds * 1000, size / 1024) for path, seconds, size in results]
+        #not modal, the report stays open while working on
+        self.export_report = QMessageBox(self)
+        self.export_report.setIcon(QMessageBox.Information)
+        self.export_report.setWindowTitle("Export finished")
+        self.export_report.setText("Saved {} file(s)".format(len(results)))
+        self.export_report.setInformativeText("\n".join(lines))
+        self.export_report.setModal(False)
+        self.export_report.show()
+
     def update_image(self):
-        self._image_ax.clear()
-        self._image_ax.imshow(self.source_image.img, cmap = self.source_image.cmap)
-        self.image_canvas.draw()
-
-    def draw_histogram(self):
-        r_channel_hist = Histogram.compute_histogram(self.source_image.img, [0])
-        g_channel_hist = Histogram.compute_histogram(self.source_image.img, [1])
-        b_channel_hist = Histogram.compute_histogram(self.source_image.img, [2])
-        avg_hist = (r_channel_hist + g_channel_hist + b_channel_hist)/3
-        self._histogram_ax.clear()
-        self._histogram_ax.set_xlim([0, 256])
-        x = [i for i in range(r_channel_hist.ravel().shape[0])]
-        y = [0 for i in range(r_channel_hist.ravel().shape[0])]
-
-        if self.r_hist_checkbox.isChecked():
-            self._histogram_ax.plot(r_channel_hist, 'r-.', alpha = 0.4)
-            self._histogram_ax.fill_between(x, r_channel_hist.ravel(), y, facecolor='red', alpha=0.2)
-        
-        if self.g_hist_checkbox.isChecked():
-            self._histogram_ax.plot(g_channel_hist, 'g-.', alpha = 0.4)
-            self._histogram_ax.fill_between(x, g_channel_hist.ravel(), y, facecolor='green', alpha=0.2)
-        
-        if self.b_hist_checkbox.isChecked():
-            self._histogram_ax.plot(b_channel_hist, 'b-.', alpha = 0.4)
-            self._histogram_ax.fill_between(x, b_channel_hist.ravel(), y, facecolor='blue', alpha=0.2)
-        
-        if self.avg_hist_checkbox.isChecked():
-            self._histogram_ax.plot(avg_hist, 'k-', alpha = 0.4)
-            self._histogram_ax.fill_between(x, avg_hist.ravel(), y, facecolor='black', alpha=0.2)
-        self.histogram_canvas.draw()
+        self.source_image.take_dirty_region()
+        self.image_view.show(self.source_image.img, self.source_image.cmap)
+        self.inspector.refresh()
+
+    def update_image_region(self):
+        """redraw only the part of the canvas covering the regions changed since the last update"""
+        region = self.source_image.take_dirty_region()
+        if region is not None:
+            self.image_view.show_region(self.source_image.img, region)
+            self.inspector.refresh()
+
+    def draw_histogram(self, histograms=None):
+        if histograms is None:
+            histograms = self.source_image.histograms()
+        visible = [self.r_hist_checkbox.isChecked(), self.g_hist_checkbox.isChecked(),
+                   self.b_hist_checkbox.isChecked(), self.avg_hist_checkbox.isChecked()]
+        self.histogram_view.show(list(histograms), visible)
 
     def normalize_histogram(self):
         dlg = NormalizeDialog(self)
-        if dlg.exec_():
+        if self.exec_with_preview(dlg, Histogram.normalize_histogram):
             a, b = dlg.get_values()
-            self.source_image.img = Histogram.normalize_histogram(self.source_image.img, a, b)
+            self.run_operation(Histogram.normalize_histogram, a, b)
 
     def equalize_histogram_grayscale(self):
-        self.source_image.img = Histogram.equalize_histogram_grayscale(self.source_image.img)
+        self.run_operation(Histogram.equalize_histogram_grayscale)
 
     def equalize_histogram_YCrCb(self):
-        self.source_image.img = Histogram.equalize_histogram_YCrCb(self.source_image.img)
+        self.run_operation(Histogram.equalize_histogram_YCrCb)
     
     def brighten(self):
         dlg = BrightnessDialog(self)
-        if dlg.exec_():
+        if self.exec_with_preview(dlg, Brightness.gamma_correction):
             gamma = dlg.get_values()
-            self.source_image.img = Brightness.gamma_correction(self.source_image.img, gamma)
+            self.run_operation(Brightness.gamma_correction, gamma)
 
     def grayscale_conversion(self):
-        self.source_image.img = Conversion.convert_2_gray(self.source_image.img)
-        self.source_image.cmap = "gray"
-        self.update_image()
+        self.run_operation(Conversion.convert_2_gray, on_result=self.set_gray_image)
         
     def otsu_binarization(self):
-        try:
-            self.source_image.img = Binarization.otsu(self.source_image.img)
-        except GrayscaleConversionError as te:
-                msg = QMessageBox()
-                msg.setIcon(QMessageBox.Critical)
-                msg.setText(str(te))
-                msg.setWindowTitle("Invalid Image conversion")
-                msg.exec_()
+        self.run_operation(Binarization.otsu)
 
     def niblack_binarization(self):
         dlg = NiblackDialog(self)
-        if dlg.exec_():
+        if self.exec_with_preview(dlg, Binarization.niblack):
             kernel, k = dlg.get_values()
-            try:
-                self.source_image.img = Binarization.niblack(self.source_image.img, kernel, k)
-            except GrayscaleConversionError as te:
-                msg = QMessageBox()
-                msg.setIcon(QMessageBox.Critical)
-                msg.setText(str(te))
-                msg.setWindowTitle("Invalid Image conversion")
-                msg.exec_()
+            self.run_operation(Binarization.niblack, kernel, k)
 
     def binary_thresholding(self):
         dlg = BinaryThresholdingDialog(self)
-        if dlg.exec_():
+        if self.exec_with_preview(dlg, Binarization.binary_thresholding):
             thresh = dlg.get_values()
-            try:
-                self.source_image.img = Binarization.binary_thresholding(self.source_image.img, thresh)
-            except GrayscaleConversionError as te:
-                msg = QMessageBox()
-                msg.setIcon(QMessageBox.Critical)
-                msg.setText(str(te))
-                msg.setWindowTitle("Invalid Image conversion")
-                msg.exec_()
+            self.run_operation(Binarization.binary_thresholding, thresh)
 
     def linear_filter(self):
         dlg = LinearFilterDialog(self)
         if dlg.exec_():
             kernel = dlg.get_values()
-            self.source_image.img = Filter.linear_filter(self.source_image.img, kernel)
+            self.run_operation(Filter.linear_filter, kernel)
 
     def kuwahara_filter(self):
         dlg = KuwaharaFilterDialog(self)
-        if dlg.exec_():
+        if self.exec_with_preview(dlg, Filter.kuwahara_filter):
             kernel = dlg.get_values()
-            self.source_image.img = Filter.kuwahara_filter(self.source_image.img, kernel)
+            self.run_operation(Filter.kuwahara_filter, kernel)
 
 
     def median_filter(self):
         dlg = MedianFilterDialog(self)
         if dlg.exec_():
-            kernel = dlg.get_values()
-            self.source_image.img = Filter.median(self.source_image.img, kernel)
+            kernel, percentile = dlg.get_values()
+            if percentile == 50:
+                self.run_operation(Filter.median, kernel)
+            else:
+                self.run_operation(Filter.percentile_filter, kernel, percentile)
 
     def box_blur_filter(self):
-        self.source_image.img = Filter.box_blur(self.source_image.img)
+        self.run_operation(Filter.box_blur)
 
     def gaussian_blur_filter(self):
-        self.source_image.img = Filter.gaussian_blur(self.source_image.img)
+        self.run_operation(Filter.gaussian_blur)
+
+    def exec_with_preview(self, dlg, operation):
+        """run the dialog while showing operation applied to a screen sized proxy of the image"""
+        if self.source_image.img is None:
+            return dlg.exec_()
+        max_side = max(self.image_canvas.width(), self.image_canvas.height())
+        preview = LivePreview(dlg, operation, self.source_image.preview_image(max_side), self.image_view,
+                              self.source_image.img.shape, self.source_image.cmap, self.statusbar)
+        try:
+            return dlg.exec_()
+        finally:
+            preview.close()
+            self.update_image()
+
+    def run_operation(self, operation, *params, on_result=None):
+        """queue operation on the current image, its result replaces the image when the worker finishes;
+        on_result gets the result and its undo step, which is built on the worker as well"""
+        if self.source_image.img is None and not self.source_image.loading:
+            return
+        if on_result is None:
+            on_result = lambda result: self.set_image(result[0], operation, params, step=result[1])
+        self.jobs.submit(operation, *params, on_result=on_result, on_error=self.on_operation_error,
+                         prepare=lambda before, after: (after, _history_step(before, after, operation, params)))
+
+    def set_image(self, image, operation=None, params=(), step=None):
+        self.source_image.apply(image, operation, params, step)
+
+    def set_gray_image(self, result):
+        image, step = result
+        self.source_image.apply(image, Conversion.convert_2_gray, step=step)
+
+    def undo(self):
+        if self.jobs.current is not None:
+            self.statusbar.showMessage("Wait for the running operation to finish", 3000)
+        elif not self.source_image.undo():
+            self.statusbar.showMessage("Nothing to undo", 3000)
+
+    def redo(self):
+        if self.jobs.current is not None:
+            self.statusbar.showMessage("Wait for the running operation to finish", 3000)
+        elif not self.source_image.redo():
+            self.statusbar.showMessage("Nothing to redo", 3000)
+
+    def on_operation_error(self, error):
+        msg = QMessageBox()
+        msg.setIcon(QMessageBox.Critical)
+        msg.setText(str(error))
+        if isinstance(error, GrayscaleConversionError):
+            msg.setWindowTitle("Invalid Image conversion")
+        else:
+            msg.setWindowTitle("Operation failed")
+        msg.exec_()
+
+    def on_job_timed(self, job, wall, cpu):
+        name = instrumentation.unwrap(job.operation).__qualname__
+        self.statusbar.showMessage("{}: {:.1f} ms".format(name, wall * 1000), 5000)
+        if instrumentation.is_enabled():
+            instrumentation.registry.record('MainWindow.' + name, wall, cpu, job.allocated, job.image, None,
+                                            job.params)
+
+    def on_jobs_busy(self, busy):
+        self.job_progress.setValue(0)
+        self.job_progress.setVisible(busy)
+        self.cancel_job_btn.setVisible(busy)
+        if not busy and self.source_image.loading:
+            #decoding the page was cancelled or failed
+            self.source_image.loading = False
 
     def close_app(self):
         sys.exit(app.exec_())
 
     def on_move(self, event):
         if event.inaxes:
-            ax = event.inaxes  # the axes instance
-            self.source_image.x = int(round(event.xdata))
-            self.source_image.y = int(round(event.ydata))
-            if self.source_image.image_pixelmap != None:
-
-                r,g,b = tuple(self.source_image.image_pixelmap[self.source_image.x, self.source_image.y])
-                self.r_value.setText(str(r))
-                self.g_value.setText(str(g))
-                self.b_value.setText(str(b))
+            #only recorded here, fast mouse movement would otherwise flood the event loop
+            self.inspector.probe(int(round(event.xdata)), int(round(event.ydata)))
+
+    def on_probed(self, x, y, rgb, mean, std):
+        self.source_image.x = x
+        self.source_image.y = y
+        for edit, value in zip((self.r_value, self.g_value, self.b_value), rgb):
+            if edit.text() != str(value):
+                edit.setText(str(value))
+        size = 2 * NEIGHBOURHOOD_RADIUS + 1
+        self.neighbourhood_label.setText("{}x{} mean {} std {}".format(
+            size, size, "/".join("{:.1f}".format(v) for v in mean), "/".join("{:.1f}".format(v) for v in std)))
 
     def on_click(self, event):
-        if event.button is MouseButton.LEFT:
+        if event.button == LEFT_BUTTON:
             self.image_canvas.mpl_disconnect(self.mouse_move_connection_id)
 
     def on_leave_figure(self, event):
@@ -286,14 +387,17 @@ class MainWindow(QMainWindow):
             self.draw_histogram()
             
     def change_rgb_value(self):
-        if(self.x != None or self.y != None):
+        if self.jobs.current is not None:
+            self.statusbar.showMessage("Wait for the running operation to finish", 3000)
+            return
+        if(self.source_image.x != None and self.source_image.y != None and self.source_image.img is not None):
             try:
                 r = int(self.r_value.text())
                 g = int(self.g_value.text())
                 b = int(self.b_value.text())
-                self.source_image.image_pixelmap[self.source_image.x, self.source_image.y] = r, g, b
-                self._image_ax.imshow(self.source_image.img, cmap = self.source_image.cmap )
-                self.image_canvas.draw()
+                self.source_image.set_pixel(self.source_image.x, self.source_image.y, (r, g, b))
+                self.update_image_region()
+                self.draw_histogram()
 
             except ValueError:
                 msg = QMessageBox()
@@ -304,42 +408,157 @@ class MainWindow(QMainWindow):
 
 
                 
+def _history_step(before, after, operation, params):
+    #runs on the job's worker thread, the step is pushed when the result is applied
+    if before is None or after is None or after is before:
+        return None
+    return make_step(before, after, operation, params)
+
+
 class SourceImage:
     """description of class"""
     def __init__(self, *args, **kwargs):
 
         #initialization of image
         self._img = None
-        self.image_pixelmap = None
         
         #image file information
         self.image_stem = None
         self.image_suffix = None 
         self.path_to_image = None
 
+        #opened file, its current page and whether that page is still being decoded
+        self.file = None
+        self.page = 0
+        self.loading = False
+
         #image coordinates
         self.x = None
         self.y = None
     
-        #image cmap
+        #image cmap, gray for grayscale images, follows the image on every change including undo and redo
         self.cmap = None
+
+        #incremented on every change of the image, derived representations (histograms, grayscale,
+        #pyramid levels...) are cached in derived_cache until the next change
+        self.version = 0
+
+        #changed rectangles (top, left, bottom, right) not yet shown on the canvas
+        self.dirty_regions = []
+
+        #undo/redo steps of the image
+        self.history = History()
+
     @property
     def img(self):
         return self._img
 
     @img.setter
     def img(self, value):
+        self.apply(value)
+
+    def apply(self, value, operation=None, params=(), step=None):
+        """replace the image and record the change, operation and params allow replaying it on redo;
+        step is the change already made with history.make_step from the current image"""
+        if self._img is not None and value is not None and value is not self._img:
+            if step is not None:
+                self.history.push(step)
+            else:
+                self.history.record(self._img, value, operation, params)
+        self._replace(value)
+
+    def reset(self, value):
+        """replace the image and forget the history, used when a new file is loaded"""
+        self.history.clear()
+        self._replace(value)
+
+    def begin_loading(self, page):
+        """forget the current image while the page of the file is decoded"""
+        self.page = page
+        self.loading = True
+        self.history.clear()
+        self._img = None
+        self.mark_changed()
+
+    def undo(self):
+        image = self.history.undo(self._img)
+        if image is not None:
+            self._replace(image)
+        return image is not None
+
+    def redo(self):
+        image = self.history.redo(self._img)
+        if image is not None:
+            self._replace(image)
+        return image is not None
+
+    def _replace(self, value):
         self._img = value
+        if value is not None:
+            self.cmap = "gray" if np.ndim(value) == 2 else None
+            derived_cache.track(value)
+        self.mark_changed()
         MainWindow.update_image(main)
         # update histogram each time the image is changed
         MainWindow.draw_histogram(main)
 
-class NavigationToolbar(NavigationToolbar2QT):
-    # only display the buttons we need
-    toolitems = [t for t in NavigationToolbar2QT.toolitems if
-                 t[0] in ('Home', 'Pan', 'Forward', 'Back', 'Zoom')]
+    def mark_changed(self, region=None):
+        """bump the image version, region is the changed (top, left, bottom, right) rectangle, None for the whole image"""
+        self.version += 1
+        if self._img is not None:
+            derived_cache.invalidate(self._img)
+        if region is None and self._img is not None:
+            region = (0, 0) + np.shape(self._img)[:2]
+        if region is not None:
+            self.dirty_regions.append(region)
+
+    def take_dirty_region(self):
+        """bounding rectangle of all regions changed since the last call, None when nothing changed"""
+        if not self.dirty_regions:
+            return None
+        tops, lefts, bottoms, rights = zip(*self.dirty_regions)
+        self.dirty_regions = []
+        return min(tops), min(lefts), max(bottoms), max(rights)
+
+    def pixel(self, x, y):
+        value = self._img[y, x]
+        if np.ndim(value) == 0:
+            return value, value, value
+        return tuple(value[:3])
+
+    def set_pixel(self, x, y, rgb):
+        patch = np.array(rgb, np.uint8).reshape(1, 1, 3)
+        if len(self._img.shape) == 2:
+            patch = Conversion.convert_2_gray(patch)
+        self.update_region((y, x, y + 1, x + 1), patch)
+
+    def update_region(self, region, patch):
+        """write patch into the region of the image, updating the cached histograms incrementally"""
+        top, left, bottom, right = region
+        view = self._img[top:bottom, left:right]
+        self.history.record_region((top, left), view, patch)
+        histograms = derived_cache.peek(self._img, ('histograms',))
+        if histograms is not None:
+            histograms = histograms - Histogram.compute_histograms(view) + Histogram.compute_histograms(patch)
+        view[...] = patch
+        self.mark_changed(region)
+        if histograms is not None:
+            derived_cache.put(self._img, ('histograms',), histograms)
+
+    def preview_image(self, max_side):
+        """largest pyramid level of the current image whose sides fit in max_side"""
+        image, level = self._img, 0
+        while max(image.shape[:2]) > max_side and min(image.shape[:2]) > 1:
+            level += 1
+            image = representation(self._img, 'pyramid', level)
+        return image
+
+    def histograms(self):
+        """R, G, B and luminance histograms of the current image, cached until the image changes"""
+        return representation(self._img, 'histograms')
 
 class NormalizeDialog(QDialog):
+    parameters_changed = pyqtSignal()
 
     def __init__(self, img,  *args, **kwargs):
         super(NormalizeDialog, self).__init__(*args, **kwargs)
@@ -368,6 +587,8 @@ class NormalizeDialog(QDialog):
 
         self.high_input.valueChanged.connect(self.validate)
         self.low_input.valueChanged.connect(self.validate)
+        self.high_input.valueChanged.connect(self.parameters_changed)
+        self.low_input.valueChanged.connect(self.parameters_changed)
 
         self.input_layout.addWidget(self.low_label)
         self.input_layout.addWidget(self.low_input)
@@ -392,6 +613,7 @@ class NormalizeDialog(QDialog):
         return self.low_input.value(), self.high_input.value()
 
 class BrightnessDialog(QDialog):
+    parameters_changed = pyqtSignal()
 
     def __init__(self, img,  *args, **kwargs):
         super(BrightnessDialog, self).__init__(*args, **kwargs)
@@ -422,6 +644,7 @@ class BrightnessDialog(QDialog):
         self.input_layout.addWidget(self.input_value)
         
         self.input.valueChanged.connect(self.update)
+        self.input.valueChanged.connect(self.parameters_changed)
 
         self.layout.addLayout(self.input_layout)
         self.layout.addWidget(self.buttonBox)
@@ -434,6 +657,7 @@ class BrightnessDialog(QDialog):
         return self.input.value()/100
 
 class BinaryThresholdingDialog(QDialog):
+    parameters_changed = pyqtSignal()
 
     def __init__(self, img,  *args, **kwargs):
         super(BinaryThresholdingDialog, self).__init__(*args, **kwargs)
@@ -464,6 +688,7 @@ class BinaryThresholdingDialog(QDialog):
         self.input_layout.addWidget(self.input_value)
         
         self.input.valueChanged.connect(self.update)
+        self.input.valueChanged.connect(self.parameters_changed)
 
         self.layout.addLayout(self.input_layout)
         self.layout.addWidget(self.buttonBox)
@@ -476,6 +701,7 @@ class BinaryThresholdingDialog(QDialog):
         return self.input.value()
 
 class NiblackDialog(QDialog):
+    parameters_changed = pyqtSignal()
 
     def __init__(self, img,  *args, **kwargs):
         super(NiblackDialog, self).__init__(*args, **kwargs)
@@ -512,6 +738,9 @@ class NiblackDialog(QDialog):
         self.input_layout.addWidget(self.input)
         self.input_layout.addWidget(self.label_2)
         self.input_layout.addWidget(self.input_2)
+
+        self.input.valueChanged.connect(self.parameters_changed)
+        self.input_2.valueChanged.connect(self.parameters_changed)
         
         
         self.layout.addLayout(self.input_layout)
@@ -609,7 +838,76 @@ class LinearFilterDialog(QDialog):
         output = [[self.inputs[(i, j)].value() for i in range(3)] for j in range(3)] 
         return np.array(output, np.float32)
 
+class ExportDialog(QDialog):
+    #formats offered, the suffix of the chosen file name replaces its equivalent
+    SUFFIXES = ['png', 'tiff', 'bmp', 'jpg', 'gif']
+
+    def __init__(self, suffix, *args, **kwargs):
+        super(ExportDialog, self).__init__(*args, **kwargs)
+        self.setWindowTitle("Export")
+        QBtn = QDialogButtonBox.Ok | QDialogButtonBox.Cancel
+        self.buttonBox = QDialogButtonBox(QBtn)
+        self.buttonBox.accepted.connect(self.accept)
+        self.buttonBox.rejected.connect(self.reject)
+
+        self.layout = QtWidgets.QVBoxLayout()
+
+        self.groupBox = QtWidgets.QGroupBox('Formats')
+        self.format_layout = QtWidgets.QHBoxLayout()
+        self.checkboxes = {}
+        for name in self.SUFFIXES:
+            if suffix in FORMATS and FORMATS[suffix][0] == FORMATS[name][0]:
+                name = suffix
+            self.checkboxes[name] = QtWidgets.QCheckBox(name.upper())
+            self.checkboxes[name].setChecked(name == suffix)
+            self.format_layout.addWidget(self.checkboxes[name])
+        self.groupBox.setLayout(self.format_layout)
+
+        self.input_layout = QtWidgets.QHBoxLayout()
+
+        self.png_label = QLabel()
+        self.png_label.setText("PNG compression:")
+        self.png_input = QSpinBox()
+        self.png_input.setRange(0, 9)
+        self.png_input.setValue(6)
+
+        self.tiff_label = QLabel()
+        self.tiff_label.setText("TIFF compression:")
+        self.tiff_input = QtWidgets.QComboBox()
+        self.tiff_input.addItems(list(TIFF_COMPRESSIONS))
+        self.tiff_input.setCurrentText('LZW')
+
+        self.jpg_label = QLabel()
+        self.jpg_label.setText("JPEG quality:")
+        self.jpg_input = QSpinBox()
+        self.jpg_input.setRange(1, 95)
+        self.jpg_input.setValue(95)
+
+        for widget in (self.png_label, self.png_input, self.tiff_label, self.tiff_input, self.jpg_label, self.jpg_input):
+            self.input_layout.addWidget(widget)
+
+        self.layout.addWidget(self.groupBox)
+        self.layout.addLayout(self.input_layout)
+        self.layout.addWidget(self.buttonBox)
+        self.setLayout(self.layout)
+
+    def get_values(self):
+        """checked suffixes and the encoder options of each of them"""
+        formats = [name for name, checkbox in self.checkboxes.items() if checkbox.isChecked()]
+        options = {}
+        for name in formats:
+            kind = FORMATS[name][0]
+            if kind == 'PNG':
+                options[name] = {'compress_level': self.png_input.value()}
+            elif kind == 'TIFF':
+                options[name] = {'compression': TIFF_COMPRESSIONS[self.tiff_input.currentText()]}
+            elif kind == 'JPEG':
+                options[name] = {'quality': self.jpg_input.value()}
+        return formats, options
+
 class MedianFilterDialog(QDialog):
+    #statistic name and percentile of the window
+    STATISTICS = [('Median', 50), ('Minimum', 0), ('Maximum', 100), ('25th percentile', 25), ('75th percentile', 75)]
 
     def __init__(self, img,  *args, **kwargs):
         super(MedianFilterDialog, self).__init__(*args, **kwargs)
@@ -623,35 +921,38 @@ class MedianFilterDialog(QDialog):
         self.layout = QtWidgets.QVBoxLayout()
         self.input_layout = QtWidgets.QHBoxLayout()
 
-        self.groupBox = QtWidgets.QGroupBox('Kernel size')
-        self.radio_3 = QtWidgets.QRadioButton('3')
-        self.radio_3.value = 3
-        self.radio_3.setChecked(True)
-        self.value = 3
+        self.label = QLabel()
+        self.label.setText("Kernel:")
 
-        self.radio_5 = QtWidgets.QRadioButton('5')
-        self.radio_5.value = 5
+        self.input = QSpinBox()
+        self.input.setMinimum(3)
+        self.input.setMaximum(51)
+        self.input.setValue(3)
+        self.input.setSingleStep(2)
 
-        self.radio_3.toggled.connect(lambda:self.update(self.radio_3))
-        self.radio_5.toggled.connect(lambda:self.update(self.radio_5))
-        
-        self.input_layout.addWidget(self.radio_3)
-        self.input_layout.addWidget(self.radio_5)
+        self.label_2 = QLabel()
+        self.label_2.setText("Statistic:")
 
-        self.groupBox.setLayout(self.input_layout)
+        self.option = QtWidgets.QComboBox()
+        for name, _ in self.STATISTICS:
+            self.option.addItem(name)
 
-        self.layout.addWidget(self.groupBox)
+        self.input_layout.addWidget(self.label)
+        self.input_layout.addWidget(self.input)
+        self.input_layout.addWidget(self.label_2)
+        self.input_layout.addWidget(self.option)
+
+        self.layout.addLayout(self.input_layout)
         self.layout.addWidget(self.buttonBox)
         self.setLayout(self.layout)
 
-    def update(self, obj):
-        self.value = obj.value
-
     def get_values(self):
-        return self.value                
+        #even sizes typed in are rounded up to the next odd one
+        return self.input.value() | 1, self.STATISTICS[self.option.currentIndex()][1]
 
 
 class KuwaharaFilterDialog(QDialog):
+    parameters_changed = pyqtSignal()
 
     def __init__(self, img,  *args, **kwargs):
         super(KuwaharaFilterDialog, self).__init__(*args, **kwargs)
@@ -675,6 +976,8 @@ class KuwaharaFilterDialog(QDialog):
         self.input_layout.addWidget(self.input)
         self.groupBox.setLayout(self.input_layout)
 
+        self.input.valueChanged.connect(self.parameters_changed)
+
         self.layout.addWidget(self.groupBox)
         self.layout.addWidget(self.buttonBox)
         self.setLayout(self.layout)
@@ -683,10 +986,25 @@ class KuwaharaFilterDialog(QDialog):
         return self.input.value()
         
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-
-    main = MainWindow()
-    uic.loadUi('main.ui', main)
-    main.init_ui()
-    main.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    #IMAGE_METRICS=metrics.json (or .prom) records every operation and writes the metrics on exit
+    metrics_path = os.environ.get('IMAGE_METRICS')
+    if metrics_path:
+        instrumentation.enable()
+        atexit.register(instrumentation.registry.dump, metrics_path)
+
+    with startup.phase('QApplication'):
+        app = QApplication(sys.argv)
+
+    with startup.phase('setupUi'):
+        main = MainWindow()
+        main.setupUi(main)
+    with startup.phase('init_ui'):
+        main.init_ui()
+    with startup.phase('first paint'):
+        main.show()
+        app.processEvents()
+    with startup.phase('init_canvases'):
+        main.init_canvases()
+    #STARTUP_PROFILE=startup.txt writes the time of every import and init phase
+    startup.finish()
+    sys.exit(app.exec_())
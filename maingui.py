@@ -2,9 +2,10 @@
 
 # Form implementation generated from reading ui file 'main.ui'
 #
-# Created by: PyQt5 UI code generator 5.14.1
+# Created by: PyQt5 UI code generator 5.15.11
 #
-# WARNING! All changes made in this file will be lost!
+# WARNING: Any manual changes made to this file will be lost when pyuic5 is
+# run again.  Do not edit this file unless you know what you are doing.
 
 
 from PyQt5 import QtCore, QtGui, QtWidgets
@@ -18,61 +19,199 @@ class Ui_MainWindow(object):
         self.centralwidget.setObjectName("centralwidget")
         self.gridLayout = QtWidgets.QGridLayout(self.centralwidget)
         self.gridLayout.setObjectName("gridLayout")
+        self.tabWidget = QtWidgets.QTabWidget(self.centralwidget)
+        self.tabWidget.setObjectName("tabWidget")
+        self.image_view = QtWidgets.QWidget()
+        self.image_view.setObjectName("image_view")
+        self.gridLayout_2 = QtWidgets.QGridLayout(self.image_view)
+        self.gridLayout_2.setObjectName("gridLayout_2")
         self.verticalLayout = QtWidgets.QVBoxLayout()
+        self.verticalLayout.setSizeConstraint(QtWidgets.QLayout.SetMaximumSize)
         self.verticalLayout.setContentsMargins(10, 10, 10, 10)
         self.verticalLayout.setObjectName("verticalLayout")
-        self.w = QtWidgets.QWidget(self.centralwidget)
-        self.w.setObjectName("w")
-        self.verticalLayout.addWidget(self.w)
+        self.matplotlibEmbedWidget = QtWidgets.QWidget(self.image_view)
+        self.matplotlibEmbedWidget.setMinimumSize(QtCore.QSize(480, 400))
+        self.matplotlibEmbedWidget.setObjectName("matplotlibEmbedWidget")
+        self.verticalLayout.addWidget(self.matplotlibEmbedWidget)
         self.horizontalLayout = QtWidgets.QHBoxLayout()
-        self.horizontalLayout.setContentsMargins(-1, 10, -1, -1)
+        self.horizontalLayout.setSizeConstraint(QtWidgets.QLayout.SetDefaultConstraint)
+        self.horizontalLayout.setContentsMargins(-1, 0, -1, -1)
+        self.horizontalLayout.setSpacing(10)
         self.horizontalLayout.setObjectName("horizontalLayout")
-        self.label = QtWidgets.QLabel(self.centralwidget)
+        self.label = QtWidgets.QLabel(self.image_view)
         self.label.setObjectName("label")
         self.horizontalLayout.addWidget(self.label)
-        self.r_value = QtWidgets.QLineEdit(self.centralwidget)
+        self.r_value = QtWidgets.QLineEdit(self.image_view)
         self.r_value.setObjectName("r_value")
         self.horizontalLayout.addWidget(self.r_value)
-        self.label_2 = QtWidgets.QLabel(self.centralwidget)
+        self.label_2 = QtWidgets.QLabel(self.image_view)
         self.label_2.setObjectName("label_2")
         self.horizontalLayout.addWidget(self.label_2)
-        self.g_value = QtWidgets.QLineEdit(self.centralwidget)
+        self.g_value = QtWidgets.QLineEdit(self.image_view)
         self.g_value.setObjectName("g_value")
         self.horizontalLayout.addWidget(self.g_value)
-        self.label_3 = QtWidgets.QLabel(self.centralwidget)
+        self.label_3 = QtWidgets.QLabel(self.image_view)
         self.label_3.setObjectName("label_3")
         self.horizontalLayout.addWidget(self.label_3)
-        self.b_value = QtWidgets.QLineEdit(self.centralwidget)
+        self.b_value = QtWidgets.QLineEdit(self.image_view)
         self.b_value.setObjectName("b_value")
         self.horizontalLayout.addWidget(self.b_value)
         self.verticalLayout.addLayout(self.horizontalLayout)
-        self.update_btn = QtWidgets.QPushButton(self.centralwidget)
+        self.verticalLayout_2 = QtWidgets.QVBoxLayout()
+        self.verticalLayout_2.setObjectName("verticalLayout_2")
+        self.update_btn = QtWidgets.QPushButton(self.image_view)
         self.update_btn.setObjectName("update_btn")
-        self.verticalLayout.addWidget(self.update_btn)
-        self.gridLayout.addLayout(self.verticalLayout, 0, 0, 1, 1)
+        self.verticalLayout_2.addWidget(self.update_btn)
+        self.verticalLayout.addLayout(self.verticalLayout_2)
+        self.gridLayout_2.addLayout(self.verticalLayout, 0, 0, 1, 1)
+        self.tabWidget.addTab(self.image_view, "")
+        self.histogram_view = QtWidgets.QWidget()
+        self.histogram_view.setObjectName("histogram_view")
+        self.horizontalLayout_4 = QtWidgets.QHBoxLayout(self.histogram_view)
+        self.horizontalLayout_4.setObjectName("horizontalLayout_4")
+        self.horizontalLayout_3 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_3.setObjectName("horizontalLayout_3")
+        self.histogramWidget = QtWidgets.QWidget(self.histogram_view)
+        self.histogramWidget.setObjectName("histogramWidget")
+        self.horizontalLayout_3.addWidget(self.histogramWidget)
+        self.groupBox = QtWidgets.QGroupBox(self.histogram_view)
+        self.groupBox.setMinimumSize(QtCore.QSize(160, 0))
+        self.groupBox.setMaximumSize(QtCore.QSize(300, 16777215))
+        self.groupBox.setObjectName("groupBox")
+        self.gridLayout_3 = QtWidgets.QGridLayout(self.groupBox)
+        self.gridLayout_3.setObjectName("gridLayout_3")
+        spacerItem = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
+        self.gridLayout_3.addItem(spacerItem, 1, 0, 1, 1)
+        self.verticalLayout_3 = QtWidgets.QVBoxLayout()
+        self.verticalLayout_3.setObjectName("verticalLayout_3")
+        spacerItem1 = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
+        self.verticalLayout_3.addItem(spacerItem1)
+        self.r_hist_checkbox = QtWidgets.QCheckBox(self.groupBox)
+        self.r_hist_checkbox.setChecked(True)
+        self.r_hist_checkbox.setObjectName("r_hist_checkbox")
+        self.verticalLayout_3.addWidget(self.r_hist_checkbox)
+        self.g_hist_checkbox = QtWidgets.QCheckBox(self.groupBox)
+        self.g_hist_checkbox.setChecked(True)
+        self.g_hist_checkbox.setObjectName("g_hist_checkbox")
+        self.verticalLayout_3.addWidget(self.g_hist_checkbox)
+        self.b_hist_checkbox = QtWidgets.QCheckBox(self.groupBox)
+        self.b_hist_checkbox.setChecked(True)
+        self.b_hist_checkbox.setObjectName("b_hist_checkbox")
+        self.verticalLayout_3.addWidget(self.b_hist_checkbox)
+        self.avg_hist_checkbox = QtWidgets.QCheckBox(self.groupBox)
+        self.avg_hist_checkbox.setChecked(True)
+        self.avg_hist_checkbox.setObjectName("avg_hist_checkbox")
+        self.verticalLayout_3.addWidget(self.avg_hist_checkbox)
+        self.gridLayout_3.addLayout(self.verticalLayout_3, 0, 0, 1, 1)
+        self.horizontalLayout_3.addWidget(self.groupBox)
+        self.horizontalLayout_4.addLayout(self.horizontalLayout_3)
+        self.tabWidget.addTab(self.histogram_view, "")
+        self.gridLayout.addWidget(self.tabWidget, 1, 0, 1, 1)
         MainWindow.setCentralWidget(self.centralwidget)
         self.menubar = QtWidgets.QMenuBar(MainWindow)
         self.menubar.setGeometry(QtCore.QRect(0, 0, 800, 18))
         self.menubar.setObjectName("menubar")
         self.menuFile = QtWidgets.QMenu(self.menubar)
         self.menuFile.setObjectName("menuFile")
+        self.menuHistogram = QtWidgets.QMenu(self.menubar)
+        self.menuHistogram.setObjectName("menuHistogram")
+        self.menuEqualize = QtWidgets.QMenu(self.menuHistogram)
+        self.menuEqualize.setObjectName("menuEqualize")
+        self.menuEdit = QtWidgets.QMenu(self.menubar)
+        self.menuEdit.setObjectName("menuEdit")
+        self.menuBinarization = QtWidgets.QMenu(self.menubar)
+        self.menuBinarization.setObjectName("menuBinarization")
+        self.menuFilter = QtWidgets.QMenu(self.menubar)
+        self.menuFilter.setObjectName("menuFilter")
+        self.menuLow_Pass_Filter = QtWidgets.QMenu(self.menuFilter)
+        self.menuLow_Pass_Filter.setObjectName("menuLow_Pass_Filter")
         MainWindow.setMenuBar(self.menubar)
         self.statusbar = QtWidgets.QStatusBar(MainWindow)
         self.statusbar.setObjectName("statusbar")
         MainWindow.setStatusBar(self.statusbar)
         self.actionOpen = QtWidgets.QAction(MainWindow)
         self.actionOpen.setObjectName("actionOpen")
+        self.actionPreviousPage = QtWidgets.QAction(MainWindow)
+        self.actionPreviousPage.setObjectName("actionPreviousPage")
+        self.actionNextPage = QtWidgets.QAction(MainWindow)
+        self.actionNextPage.setObjectName("actionNextPage")
+        self.actionUndo = QtWidgets.QAction(MainWindow)
+        self.actionUndo.setObjectName("actionUndo")
+        self.actionRedo = QtWidgets.QAction(MainWindow)
+        self.actionRedo.setObjectName("actionRedo")
         self.actionExit = QtWidgets.QAction(MainWindow)
         self.actionExit.setObjectName("actionExit")
         self.actionSave = QtWidgets.QAction(MainWindow)
         self.actionSave.setObjectName("actionSave")
+        self.actionNormalize = QtWidgets.QAction(MainWindow)
+        self.actionNormalize.setObjectName("actionNormalize")
+        self.actionBrightness = QtWidgets.QAction(MainWindow)
+        self.actionBrightness.setObjectName("actionBrightness")
+        self.actionEqualizeGrayscale = QtWidgets.QAction(MainWindow)
+        self.actionEqualizeGrayscale.setObjectName("actionEqualizeGrayscale")
+        self.actionEqualizeYCrCb = QtWidgets.QAction(MainWindow)
+        self.actionEqualizeYCrCb.setObjectName("actionEqualizeYCrCb")
+        self.actionDefaultBW = QtWidgets.QAction(MainWindow)
+        self.actionDefaultBW.setObjectName("actionDefaultBW")
+        self.actionRed_ChannelBW = QtWidgets.QAction(MainWindow)
+        self.actionRed_ChannelBW.setObjectName("actionRed_ChannelBW")
+        self.actionGreen_ChannelBW = QtWidgets.QAction(MainWindow)
+        self.actionGreen_ChannelBW.setObjectName("actionGreen_ChannelBW")
+        self.actionBlue_ChannelBW = QtWidgets.QAction(MainWindow)
+        self.actionBlue_ChannelBW.setObjectName("actionBlue_ChannelBW")
+        self.actionOtsu = QtWidgets.QAction(MainWindow)
+        self.actionOtsu.setObjectName("actionOtsu")
+        self.actionNiblack = QtWidgets.QAction(MainWindow)
+        self.actionNiblack.setObjectName("actionNiblack")
+        self.actionBinary_Thresholding = QtWidgets.QAction(MainWindow)
+        self.actionBinary_Thresholding.setObjectName("actionBinary_Thresholding")
+        self.actionAverageBW = QtWidgets.QAction(MainWindow)
+        self.actionAverageBW.setObjectName("actionAverageBW")
+        self.actionGrayscale = QtWidgets.QAction(MainWindow)
+        self.actionGrayscale.setObjectName("actionGrayscale")
+        self.actionLinear_Filter = QtWidgets.QAction(MainWindow)
+        self.actionLinear_Filter.setObjectName("actionLinear_Filter")
+        self.actionKuwahara_Filter = QtWidgets.QAction(MainWindow)
+        self.actionKuwahara_Filter.setObjectName("actionKuwahara_Filter")
+        self.actionMedian_Filter = QtWidgets.QAction(MainWindow)
+        self.actionMedian_Filter.setObjectName("actionMedian_Filter")
+        self.actionBox_Blur = QtWidgets.QAction(MainWindow)
+        self.actionBox_Blur.setObjectName("actionBox_Blur")
+        self.actionGaussian_Blur = QtWidgets.QAction(MainWindow)
+        self.actionGaussian_Blur.setObjectName("actionGaussian_Blur")
         self.menuFile.addAction(self.actionOpen)
         self.menuFile.addAction(self.actionSave)
         self.menuFile.addSeparator()
+        self.menuFile.addAction(self.actionPreviousPage)
+        self.menuFile.addAction(self.actionNextPage)
+        self.menuFile.addSeparator()
         self.menuFile.addAction(self.actionExit)
+        self.menuEqualize.addAction(self.actionEqualizeGrayscale)
+        self.menuEqualize.addAction(self.actionEqualizeYCrCb)
+        self.menuHistogram.addAction(self.actionNormalize)
+        self.menuHistogram.addAction(self.menuEqualize.menuAction())
+        self.menuEdit.addAction(self.actionUndo)
+        self.menuEdit.addAction(self.actionRedo)
+        self.menuEdit.addSeparator()
+        self.menuEdit.addAction(self.actionBrightness)
+        self.menuEdit.addAction(self.actionGrayscale)
+        self.menuBinarization.addAction(self.actionOtsu)
+        self.menuBinarization.addAction(self.actionNiblack)
+        self.menuBinarization.addAction(self.actionBinary_Thresholding)
+        self.menuLow_Pass_Filter.addAction(self.actionBox_Blur)
+        self.menuLow_Pass_Filter.addAction(self.actionGaussian_Blur)
+        self.menuFilter.addAction(self.actionLinear_Filter)
+        self.menuFilter.addAction(self.actionKuwahara_Filter)
+        self.menuFilter.addAction(self.actionMedian_Filter)
+        self.menuFilter.addAction(self.menuLow_Pass_Filter.menuAction())
         self.menubar.addAction(self.menuFile.menuAction())
+        self.menubar.addAction(self.menuEdit.menuAction())
+        self.menubar.addAction(self.menuHistogram.menuAction())
+        self.menubar.addAction(self.menuBinarization.menuAction())
+        self.menubar.addAction(self.menuFilter.menuAction())
 
         self.retranslateUi(MainWindow)
+        self.tabWidget.setCurrentIndex(1)
         QtCore.QMetaObject.connectSlotsByName(MainWindow)
 
     def retranslateUi(self, MainWindow):
@@ -82,20 +221,49 @@ class Ui_MainWindow(object):
         self.label_2.setText(_translate("MainWindow", "G:"))
         self.label_3.setText(_translate("MainWindow", "B:"))
         self.update_btn.setText(_translate("MainWindow", "Update"))
+        self.tabWidget.setTabText(self.tabWidget.indexOf(self.image_view), _translate("MainWindow", "Image"))
+        self.groupBox.setTitle(_translate("MainWindow", "Histogram Picker"))
+        self.r_hist_checkbox.setText(_translate("MainWindow", "R Value"))
+        self.g_hist_checkbox.setText(_translate("MainWindow", "G Value"))
+        self.b_hist_checkbox.setText(_translate("MainWindow", "B Value"))
+        self.avg_hist_checkbox.setText(_translate("MainWindow", "Luminance"))
+        self.tabWidget.setTabText(self.tabWidget.indexOf(self.histogram_view), _translate("MainWindow", "Histogram"))
         self.menuFile.setTitle(_translate("MainWindow", "File"))
+        self.menuHistogram.setTitle(_translate("MainWindow", "Histogram"))
+        self.menuEqualize.setTitle(_translate("MainWindow", "Equalize"))
+        self.menuEdit.setTitle(_translate("MainWindow", "Edit"))
+        self.menuBinarization.setTitle(_translate("MainWindow", "Binarization"))
+        self.menuFilter.setTitle(_translate("MainWindow", "Filter"))
+        self.menuLow_Pass_Filter.setTitle(_translate("MainWindow", "Low Pass Filters"))
         self.actionOpen.setText(_translate("MainWindow", "Open"))
         self.actionOpen.setShortcut(_translate("MainWindow", "Ctrl+O"))
+        self.actionPreviousPage.setText(_translate("MainWindow", "Previous page"))
+        self.actionPreviousPage.setShortcut(_translate("MainWindow", "PgUp"))
+        self.actionNextPage.setText(_translate("MainWindow", "Next page"))
+        self.actionNextPage.setShortcut(_translate("MainWindow", "PgDown"))
+        self.actionUndo.setText(_translate("MainWindow", "Undo"))
+        self.actionUndo.setShortcut(_translate("MainWindow", "Ctrl+Z"))
+        self.actionRedo.setText(_translate("MainWindow", "Redo"))
+        self.actionRedo.setShortcut(_translate("MainWindow", "Ctrl+Y"))
         self.actionExit.setText(_translate("MainWindow", "Exit"))
         self.actionExit.setShortcut(_translate("MainWindow", "Esc"))
         self.actionSave.setText(_translate("MainWindow", "Save"))
         self.actionSave.setShortcut(_translate("MainWindow", "Ctrl+S"))
-
-
-if __name__ == "__main__":
-    import sys
-    app = QtWidgets.QApplication(sys.argv)
-    MainWindow = QtWidgets.QMainWindow()
-    ui = Ui_MainWindow()
-    ui.setupUi(MainWindow)
-    MainWindow.show()
-    sys.exit(app.exec_())
+        self.actionNormalize.setText(_translate("MainWindow", "Normalize"))
+        self.actionBrightness.setText(_translate("MainWindow", "Brightness"))
+        self.actionEqualizeGrayscale.setText(_translate("MainWindow", "Grayscale"))
+        self.actionEqualizeYCrCb.setText(_translate("MainWindow", "YCrCb"))
+        self.actionDefaultBW.setText(_translate("MainWindow", "Default"))
+        self.actionRed_ChannelBW.setText(_translate("MainWindow", "Red Channel"))
+        self.actionGreen_ChannelBW.setText(_translate("MainWindow", "Green Channel"))
+        self.actionBlue_ChannelBW.setText(_translate("MainWindow", "Blue Channel"))
+        self.actionOtsu.setText(_translate("MainWindow", "Otsu"))
+        self.actionNiblack.setText(_translate("MainWindow", "Niblack"))
+        self.actionBinary_Thresholding.setText(_translate("MainWindow", "Binary Thresholding"))
+        self.actionAverageBW.setText(_translate("MainWindow", "Average"))
+        self.actionGrayscale.setText(_translate("MainWindow", "Grayscale"))
+        self.actionLinear_Filter.setText(_translate("MainWindow", "Linear Filters"))
+        self.actionKuwahara_Filter.setText(_translate("MainWindow", "Kuwahara"))
+        self.actionMedian_Filter.setText(_translate("MainWindow", "Median Filter"))
+        self.actionBox_Blur.setText(_translate("MainWindow", "Box Blur"))
+        self.actionGaussian_Blur.setText(_translate("MainWindow", "Gaussian Blur"))
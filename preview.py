@@ -0,0 +1,63 @@
+"""live low resolution preview of dialog parameters
+
+The operation is applied to a screen sized proxy of the image on a worker
+thread, parameter changes are debounced and stale results are dropped.
+"""
+from PyQt5.QtCore import QObject, QThreadPool, QTimer
+
+from jobs import Job
+
+#delay after the last parameter change before the preview is computed
+PREVIEW_DELAY_MS = 150
+
+
+class LivePreview(QObject):
+    def __init__(self, dialog, operation, proxy, image_view, shape, cmap, statusbar):
+        super(LivePreview, self).__init__(dialog)
+        self.dialog = dialog
+        self.operation = operation
+        self.proxy = proxy
+        self.image_view = image_view
+        self.shape = shape
+        self.cmap = cmap
+        self.statusbar = statusbar
+        self.generation = 0
+        self.jobs = set()
+        self.pool = QThreadPool.globalInstance()
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(PREVIEW_DELAY_MS)
+        self.timer.timeout.connect(self.start)
+        dialog.parameters_changed.connect(self.timer.start)
+        self.timer.start()
+
+    def start(self):
+        self.generation += 1
+        generation = self.generation
+        values = self.dialog.get_values()
+        params = values if isinstance(values, tuple) else (values,)
+        job = Job(self.operation, params, None)
+        job.image = self.proxy
+        job.signals.finished.connect(lambda result: self.on_result(job, generation, result))
+        job.signals.failed.connect(lambda error: self.on_error(job, generation, error))
+        #keep a reference until the worker is done
+        self.jobs.add(job)
+        self.pool.start(job)
+
+    def on_result(self, job, generation, result):
+        self.jobs.discard(job)
+        if generation == self.generation:
+            cmap = self.cmap if len(result.shape) == len(self.shape) else "gray"
+            self.image_view.show_preview(result, self.shape, cmap)
+
+    def on_error(self, job, generation, error):
+        self.jobs.discard(job)
+        if generation == self.generation:
+            self.statusbar.showMessage("Preview: {}".format(error), 3000)
+
+    def close(self):
+        """stop previewing, results still running are ignored"""
+        self.timer.stop()
+        self.generation += 1
+        self.dialog.parameters_changed.disconnect(self.timer.start)
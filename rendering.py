@@ -0,0 +1,179 @@
+"""persistent matplotlib artists for the image and histogram canvases
+
+Artists are created once and updated with new data, redraws only repaint the
+axes area through blitting instead of rebuilding the whole figure.
+matplotlib is imported when the first canvas is created, so importing this
+module does not slow down the start of the application.
+"""
+import numpy as np
+from PyQt5 import QtWidgets
+
+#line style and fill colour of the R, G, B and luminance histograms
+HISTOGRAM_STYLES = [('r-.', 'red'), ('g-.', 'green'), ('b-.', 'blue'), ('k-', 'black')]
+
+#value of matplotlib MouseButton.LEFT
+LEFT_BUTTON = 1
+
+#edited regions drawn as patches over the image before they are folded into it with one full update
+MAX_OVERLAYS = 64
+
+
+def create_canvas(widget, window):
+    """(layout, canvas, axes) of a matplotlib canvas with a navigation toolbar filling widget"""
+    from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg, NavigationToolbar2QT
+    from matplotlib.figure import Figure
+
+    class NavigationToolbar(NavigationToolbar2QT):
+        # only display the buttons we need
+        toolitems = [t for t in NavigationToolbar2QT.toolitems if
+                     t[0] in ('Home', 'Pan', 'Forward', 'Back', 'Zoom')]
+
+    layout = QtWidgets.QVBoxLayout(widget)
+    canvas = FigureCanvasQTAgg(Figure())
+    layout.addWidget(NavigationToolbar(canvas, window))
+    layout.addWidget(canvas)
+    return layout, canvas, canvas.figure.subplots()
+
+
+class ImageView:
+    def __init__(self, canvas, ax):
+        self.canvas = canvas
+        self.ax = ax
+        self.artist = None
+        self.shape = None
+        #small images of edited regions drawn over the artist, whose own data is not updated
+        self.overlays = []
+
+    def show(self, image, cmap=None):
+        image = np.asarray(image)
+        self._clear_overlays()
+        if self.artist is None or self.shape[:2] != image.shape[:2]:
+            #new image size, axes limits and ticks have to be laid out again
+            self.ax.clear()
+            self.artist = self.ax.imshow(image, cmap=cmap)
+            self.shape = image.shape
+            self.canvas.draw()
+            return
+        self.shape = image.shape
+        self.artist.set_data(image)
+        self.artist.set_extent(self._extent(image.shape))
+        self.artist.set_cmap(cmap)
+        if len(image.shape) == 2:
+            self.artist.autoscale()
+        self._blit(self.ax.bbox)
+
+    def show_preview(self, image, shape, cmap=None):
+        """show a downsampled image stretched over the extent of a full image of the given shape"""
+        if self.artist is None or self.shape[:2] != shape[:2]:
+            return
+        self._clear_overlays()
+        self.artist.set_data(image)
+        self.artist.set_extent(self._extent(shape))
+        self.artist.set_cmap(cmap)
+        if len(np.shape(image)) == 2:
+            self.artist.autoscale()
+        self._blit(self.ax.bbox)
+
+    def show_reduced(self, image, shape, cmap=None):
+        """like show_preview, but lays the axes out for the given full shape when nothing of that shape is shown"""
+        if self.artist is None or self.shape[:2] != shape[:2]:
+            self.overlays = []
+            self.ax.clear()
+            self.artist = self.ax.imshow(image, cmap=cmap, extent=self._extent(shape))
+            self.shape = tuple(shape)
+            self.canvas.draw()
+            return
+        self.show_preview(image, shape, cmap)
+
+    def show_region(self, image, region):
+        """repaint only the (top, left, bottom, right) region of the image, the cost follows the size of the region;
+        the region is drawn as a patch over the shown image, the patches are folded into it every MAX_OVERLAYS edits.
+        When the image is shown downsampled, the edges of a patch are not smoothed into their neighbours
+        until then"""
+        image = np.asarray(image)
+        if self.artist is None or self.shape != image.shape or len(self.overlays) >= MAX_OVERLAYS:
+            self.show(image, self.artist.get_cmap() if len(image.shape) == 2 and self.artist is not None else None)
+            return
+        top, left, bottom, right = region
+        patch = image[top:bottom, left:right].copy()
+        if len(image.shape) == 2:
+            #values outside the colour limits rescale the whole image
+            vmin, vmax = self.artist.get_clim()
+            if patch.min() < vmin or patch.max() > vmax:
+                self.show(image, self.artist.get_cmap())
+                return
+        from matplotlib.image import AxesImage
+        from matplotlib.transforms import Bbox
+        #created directly, imshow and set_extent would rescale the axes to the patch
+        overlay = AxesImage(self.ax, cmap=self.artist.get_cmap(), norm=self.artist.norm,
+                            interpolation=self.artist.get_interpolation(),
+                            extent=(left - 0.5, right - 0.5, bottom - 0.5, top - 0.5))
+        overlay.set_data(patch)
+        self.ax.add_image(overlay)
+        self.overlays.append(overlay)
+        corners = self.ax.transData.transform([(left - 0.5, top - 0.5), (right - 0.5, bottom - 0.5)])
+        (x0, y0), (x1, y1) = corners.min(axis=0), corners.max(axis=0)
+        bbox = Bbox.intersection(Bbox.from_extents(x0 - 1, y0 - 1, x1 + 1, y1 + 1), self.ax.bbox)
+        if bbox is not None:
+            self.ax.draw_artist(overlay)
+            self.canvas.blit(bbox)
+
+    def _clear_overlays(self):
+        for overlay in self.overlays:
+            overlay.remove()
+        self.overlays = []
+
+    def _blit(self, bbox):
+        self.ax.draw_artist(self.artist)
+        self.canvas.blit(bbox)
+
+    @staticmethod
+    def _extent(shape):
+        return (-0.5, shape[1] - 0.5, shape[0] - 0.5, -0.5)
+
+
+class HistogramView:
+    def __init__(self, canvas, ax):
+        self.canvas = canvas
+        self.ax = ax
+        self.background = None
+        self.x = np.arange(256)
+        self.ax.set_xlim([0, 256])
+        self.ax.set_ylim([0, 1])
+        self.lines = []
+        self.fills = []
+        for style, color in HISTOGRAM_STYLES:
+            line, = self.ax.plot(self.x, np.zeros(256), style, alpha=0.4, animated=True)
+            fill = self.ax.fill_between(self.x, np.zeros(256), 0, facecolor=color, alpha=0.2, animated=True)
+            self.lines.append(line)
+            self.fills.append(fill)
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def show(self, histograms, visible):
+        """histograms are the R, G, B and luminance rows, visible tells which of them are drawn"""
+        top = 0
+        for hist, show, line, fill in zip(histograms, visible, self.lines, self.fills):
+            hist = np.ravel(hist)
+            line.set_ydata(hist)
+            fill.set_verts([np.concatenate([np.column_stack([self.x, hist]), [[self.x[-1], 0], [self.x[0], 0]]])])
+            line.set_visible(show)
+            fill.set_visible(show)
+            if show:
+                top = max(top, hist.max())
+        ylim = (0, top * 1.05 if top > 0 else 1)
+        if ylim != self.ax.get_ylim() or self.background is None:
+            #tick labels change, the whole figure is drawn and the background stored again
+            self.ax.set_ylim(ylim)
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self._draw_artists()
+        self.canvas.blit(self.ax.bbox)
+
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for artist in self.fills + self.lines:
+            self.ax.draw_artist(artist)
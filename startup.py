@@ -0,0 +1,74 @@
+"""startup profile of the interface
+
+With STARTUP_PROFILE set to a file name, every import made by main.py (with
+everything it pulls in) and every init phase of the window is timed, the
+report is written once the window is ready.
+
+usage example:
+    STARTUP_PROFILE=startup.txt python main.py
+"""
+import builtins
+import os
+import time
+from contextlib import contextmanager
+
+PROFILE_PATH = os.environ.get('STARTUP_PROFILE')
+#imports faster than this (mostly modules already loaded) are left out of the report
+MIN_REPORTED = 0.0001
+
+_start = time.perf_counter()
+#(kind, name, seconds) in the order they finished
+entries = []
+_depth = 0
+_original_import = builtins.__import__
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    #only outermost imports are recorded, nested ones are part of their time
+    global _depth
+    if _depth:
+        return _original_import(name, globals, locals, fromlist, level)
+    _depth += 1
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _depth -= 1
+        entries.append(('import', name, time.perf_counter() - start))
+
+
+@contextmanager
+def phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        entries.append(('phase', name, time.perf_counter() - start))
+
+
+def report():
+    total = time.perf_counter() - _start
+    lines = ['startup profile: {:.1f} ms since the start of main.py'.format(total * 1000)]
+    for kind, title in (('import', 'imports (slowest first)'), ('phase', 'init phases')):
+        selected = [(name, seconds) for entry_kind, name, seconds in entries if entry_kind == kind]
+        if kind == 'import':
+            #the same module imported again costs nothing, keep the first time it was imported
+            first = {}
+            for name, seconds in selected:
+                first.setdefault(name, seconds)
+            selected = sorted((item for item in first.items() if item[1] >= MIN_REPORTED), key=lambda item: -item[1])
+        lines.append(title)
+        lines.extend('  {:9.1f} ms  {}'.format(seconds * 1000, name) for name, seconds in selected)
+    return '\n'.join(lines) + '\n'
+
+
+def finish():
+    """stop timing imports and write the report when profiling is on"""
+    builtins.__import__ = _original_import
+    if PROFILE_PATH:
+        with open(PROFILE_PATH, 'w') as f:
+            f.write(report())
+
+
+if PROFILE_PATH:
+    builtins.__import__ = _timed_import
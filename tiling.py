@@ -0,0 +1,179 @@
+"""tiled processing of images that do not fit in memory, and parallel processing in row bands
+
+Source and result live in memory-mapped files, only one tile (plus its halo)
+is held in RAM at a time. process_bands runs the bands of one image on a
+thread pool instead, OpenCV and NumPy release the GIL while they work.
+
+usage example:
+    source = np.load('scan.npy', mmap_mode='r')
+    result = process_tiled(source, Filter.median, 5, out='scan_median.npy')
+    result = process_bands(image, Filter.kuwahara_filter, 15, workers=8)
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+import PIL.Image
+
+from image_processing import Brightness, Conversion, Binarization, Filter
+
+DEFAULT_TILE_SIZE = 1024
+
+#threads of process_bands, IMAGE_WORKERS overrides the number of cores
+DEFAULT_WORKERS = int(os.environ.get('IMAGE_WORKERS', 0)) or os.cpu_count() or 1
+#bands per worker, more bands balance the load and report progress more often
+BANDS_PER_WORKER = 4
+#thinner bands would spend most of their time on the halo
+MIN_BAND_HEIGHT = 64
+
+#channel order of raw PIL tiles that can be mapped without decoding
+_RAW_MODES = {
+    'RGB': (3, False),
+    'BGR': (3, True),
+    'L': (1, False),
+}
+
+#neighbourhood radius of every tile-local operation, given its parameters
+HALO_RADIUS = {
+    Brightness.gamma_correction: lambda gamma: 0,
+    Conversion.convert_2_gray: lambda: 0,
+    Binarization.binary_thresholding: lambda thresh: 0,
+    Binarization.niblack: lambda kernel, k: kernel // 2,
+    Binarization.sauvola: lambda kernel, k=0.5, r=128: kernel // 2,
+    Binarization.phansalkar: lambda kernel, k=0.25, p=2.0, q=10.0, r=0.5: kernel // 2,
+    Filter.median: lambda kernel: kernel // 2,
+    Filter.percentile_filter: lambda kernel, percentile: kernel // 2,
+    Filter.linear_filter: lambda kernel: max(np.shape(kernel)) // 2,
+    Filter.box_blur: lambda: 1,
+    Filter.gaussian_blur: lambda: 2,
+    Filter.kuwahara_filter: lambda kernel: kernel // 2,
+}
+
+#operations taking a progress keyword, process_bands passes them the progress of their band
+REPORTS_PROGRESS = {Filter.percentile_filter}
+
+
+class TilingError(ValueError):
+    pass
+
+
+def halo_radius(operation, *params):
+    #instrumented operations keep the original function in __wrapped__
+    operation = getattr(operation, '__wrapped__', operation)
+    if operation not in HALO_RADIUS:
+        raise TilingError('{} needs the whole image and cannot be run in tiles'.format(operation.__qualname__))
+    return HALO_RADIUS[operation](*params)
+
+
+def _raw_memmap(path, page=0):
+    """map uncompressed RGB/L strips of the file (frame page of multi-page files) directly,
+    returns None when the layout does not allow it"""
+    with PIL.Image.open(path) as img:
+        img.seek(page)
+        width, height = img.size
+        tiles = sorted(img.tile, key=lambda tile: tile[1][1])
+    if not tiles or any(tile[0] != 'raw' or tile[3][0] != tiles[0][3][0] for tile in tiles):
+        return None
+    mode, stride, orientation = tiles[0][3]
+    if mode not in _RAW_MODES:
+        return None
+    channels, reversed_channels = _RAW_MODES[mode]
+    stride = stride or width * channels
+    #strips must cover full rows and follow each other in the file
+    offset = tiles[0][2]
+    for tile in tiles:
+        left, top, right, bottom = tile[1]
+        if left != 0 or right != width or tile[2] != offset + top * stride:
+            return None
+    rows = np.memmap(path, np.uint8, 'r', offset=offset, shape=(height, stride))
+    image = np.lib.stride_tricks.as_strided(rows, (height, width, channels), (stride, channels, 1), writeable=False)
+    if orientation < 0:
+        image = image[::-1]
+    if reversed_channels:
+        image = image[:, :, ::-1]
+    return image if channels == 3 else image[:, :, 0]
+
+
+def process_tiled(source, operation, *params, out=None, tile_size=DEFAULT_TILE_SIZE, progress=None):
+    """apply operation to source tile by tile, out is a preallocated array or a .npy path for a memmap result,
+    progress is called with the finished fraction after every tile"""
+    radius = halo_radius(operation, *params)
+    height, width = source.shape[:2]
+    result = out if out is not None and not isinstance(out, (str, Path)) else None
+    tiles = -(-height // tile_size) * -(-width // tile_size)
+    done = 0
+    for top in range(0, height, tile_size):
+        for left in range(0, width, tile_size):
+            bottom, right = min(top + tile_size, height), min(left + tile_size, width)
+            #read tile with halo, clipped at the image border
+            y0, x0 = max(top - radius, 0), max(left - radius, 0)
+            y1, x1 = min(bottom + radius, height), min(right + radius, width)
+            tile = operation(np.ascontiguousarray(source[y0:y1, x0:x1]), *params)
+            if result is None:
+                shape = (height, width) + tile.shape[2:]
+                if out is None:
+                    result = np.empty(shape, tile.dtype)
+                else:
+                    result = np.lib.format.open_memmap(out, mode='w+', dtype=tile.dtype, shape=shape)
+            result[top:bottom, left:right] = tile[top - y0:bottom - y0, left - x0:right - x0]
+            done += 1
+            if progress is not None:
+                progress(done / tiles)
+    if isinstance(result, np.memmap):
+        result.flush()
+    return result
+
+
+def _band_operation(operation, source, radius, params, top, bottom, progress=None):
+    #band with halo, clipped at the image border, only the rows of the band are returned
+    y0, y1 = max(top - radius, 0), min(bottom + radius, source.shape[0])
+    kwargs = {} if progress is None else {'progress': progress}
+    return operation(np.ascontiguousarray(source[y0:y1]), *params, **kwargs)[top - y0:bottom - y0]
+
+
+def process_bands(source, operation, *params, out=None, workers=None, band_height=None, progress=None):
+    """apply operation to full-width row bands of source on a thread pool, the result is identical to
+    operation(source, *params); out is a preallocated result, progress is called with the finished fraction
+    after every band and may raise to stop the remaining bands, for REPORTS_PROGRESS operations it is also
+    called from the worker threads while the bands run"""
+    radius = halo_radius(operation, *params)
+    #instrumented operations stay wrapped, so every band is recorded
+    reports_progress = getattr(operation, '__wrapped__', operation) in REPORTS_PROGRESS
+    workers = workers or DEFAULT_WORKERS
+    height = source.shape[0]
+    if band_height is None:
+        band_height = max(-(-height // (workers * BANDS_PER_WORKER)), MIN_BAND_HEIGHT)
+    bands = [(top, min(top + band_height, height)) for top in range(0, height, band_height)]
+    result = out
+    #finished fraction of every band
+    fractions = [0.0] * len(bands)
+
+    def report(index, fraction):
+        fractions[index] = fraction
+        progress(sum(fractions) / len(bands))
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = {}
+    try:
+        for index, (top, bottom) in enumerate(bands):
+            band_progress = partial(report, index) if progress is not None and reports_progress else None
+            futures[executor.submit(_band_operation, operation, source, radius, params, top, bottom,
+                                    band_progress)] = index
+        for future in as_completed(futures):
+            band = future.result()
+            if result is None:
+                result = np.empty((height,) + band.shape[1:], band.dtype)
+            index = futures[future]
+            top, bottom = bands[index]
+            result[top:bottom] = band
+            if progress is not None:
+                report(index, 1.0)
+    finally:
+        #bands not started yet are dropped when a band failed or progress stopped the run
+        #(cancelled one by one, shutdown(cancel_futures=True) needs Python 3.9)
+        for future in futures:
+            future.cancel()
+        executor.shutdown()
+    return result